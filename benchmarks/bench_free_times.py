@@ -0,0 +1,143 @@
+# Measures finding a room's free times the way get_room_calenders does: select
+# every member's events in the requested window, then find_free_times, versus
+# the sweep over start/end dicts it replaced. Once for the whole semester (no
+# window given) and once for a one week window.
+#
+# Usage: python benchmarks/bench_free_times.py [--members 10] [--weeks 12]
+#            [--classes-per-week 12] [--recurring]
+
+import argparse
+import json
+import random
+
+from datetime import datetime, timedelta
+
+from common import time_calls
+from ics_gen import SEMESTER_START, generate_timetable, semester_end
+
+from modules.availability import find_free_times
+from modules.ical import parse_ics
+from web.windows import EventWindow
+
+
+def free_times(calendars: dict, window: EventWindow) -> list[dict]:
+    member_intervals = {}
+    for member_id, events in calendars.items():
+        events = window.select(events)
+        member_intervals[member_id] = (events.starts, events.ends)
+
+    return find_free_times(member_intervals, "member-0", window=window.bounds)
+
+
+def legacy_free_times(calendars: dict, window: EventWindow) -> list[dict]:
+    start_end_times = []
+    for member_id, events in calendars.items():
+        events = window.select(events)
+        for start, end in zip(
+            events.starts.tolist(), events.ends.tolist(), strict=True
+        ):
+            start_end_times.append(
+                {
+                    "user_id": member_id,
+                    "type": "start",
+                    "time": datetime.fromtimestamp(start),
+                }
+            )
+            start_end_times.append(
+                {
+                    "user_id": member_id,
+                    "type": "end",
+                    "time": datetime.fromtimestamp(end),
+                }
+            )
+
+    start_end_times.sort(key=lambda x: (x["time"], 1 if x["type"] == "start" else 0))
+
+    free_times_by_time = {}
+    current_free_users = []
+    for start_end in start_end_times:
+        if start_end["type"] == "end":
+            if start_end["user_id"] not in current_free_users:
+                current_free_users.append(start_end["user_id"])
+        elif start_end["user_id"] in current_free_users:
+            current_free_users.remove(start_end["user_id"])
+
+        free_times_by_time[start_end["time"].timestamp()] = current_free_users.copy()
+
+    free_times_order = sorted(free_times_by_time.keys())
+
+    free_times = []
+    for i, time_ in enumerate(free_times_order[:-1]):
+        free_users = free_times_by_time[time_]
+        if len(free_users) < 2 or "member-0" not in free_users:
+            continue
+
+        start_time = datetime.fromtimestamp(time_)
+        end_time = datetime.fromtimestamp(free_times_order[i + 1])
+        if start_time.day != end_time.day:
+            continue
+
+        free_times.append(
+            {
+                "summary": "Free time",
+                "start_time_iso": start_time,
+                "end_time_iso": end_time,
+                "duration_seconds": (end_time - start_time).seconds,
+                "free_users": free_users,
+            }
+        )
+
+    return free_times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--classes-per-week", type=int, default=12)
+    parser.add_argument("--recurring", action="store_true")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    calendars = {
+        f"member-{i}": parse_ics(
+            generate_timetable(rng, args.weeks, args.classes_per_week, args.recurring)
+        )
+        for i in range(args.members)
+    }
+
+    semester = EventWindow(None, None, horizon=semester_end(args.weeks))
+    week_start = datetime.combine(SEMESTER_START, datetime.min.time())
+    week = EventWindow(
+        int(week_start.timestamp()),
+        int((week_start + timedelta(weeks=1)).timestamp()),
+        horizon=semester.horizon,
+    )
+
+    results = {
+        "benchmark": "free_times",
+        "members": args.members,
+        "weeks": args.weeks,
+        "classes_per_week": args.classes_per_week,
+        "recurring": args.recurring,
+    }
+    for name, window in (("semester", semester), ("week", week)):
+        legacy, legacy_slots = time_calls(
+            lambda window=window: legacy_free_times(calendars, window), args.repeats
+        )
+        fast, slots = time_calls(
+            lambda window=window: free_times(calendars, window), args.repeats
+        )
+        results[name] = {
+            "legacy": {**legacy, "slots": len(legacy_slots)},
+            "find_free_times": {**fast, "slots": len(slots)},
+            "speedup": round(legacy["median_ms"] / fast["median_ms"], 1),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
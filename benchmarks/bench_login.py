@@ -0,0 +1,91 @@
+# Measures password verification throughput and event-loop lag during a
+# simulated login burst, hashing inline on the loop (how logins used to work)
+# versus through modules.passwords.
+#
+# Usage: python benchmarks/bench_login.py [--logins 64] [--rounds 12]
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from passlib.context import CryptContext
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from modules.passwords import PasswordHasher
+
+PROBE_INTERVAL = 0.005
+
+
+async def _probe_lag(samples: list[float], stop: asyncio.Event) -> None:
+    """Sleeps in short steps and records how late every wake-up is."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def _run(verify, logins: int) -> dict:
+    lag = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_lag(lag, stop))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    lag.sort()
+
+    return {
+        "logins": logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 1),
+        "loop_lag_p50_ms": round(statistics.median(lag) * 1000, 2),
+        "loop_lag_p99_ms": round(lag[int(len(lag) * 0.99) - 1] * 1000, 2),
+        "loop_lag_max_ms": round(lag[-1] * 1000, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    context = CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds
+    )
+    hashed = context.hash("correct horse battery staple")
+
+    async def inline_verify() -> bool:
+        return context.verify("correct horse battery staple", hashed)
+
+    hasher = PasswordHasher(
+        rounds=args.rounds, max_workers=args.workers, max_queue=args.logins
+    )
+
+    async def pooled_verify() -> bool:
+        return await hasher.verify("correct horse battery staple", hashed)
+
+    results = {
+        "benchmark": "login",
+        "rounds": args.rounds,
+        "workers": args.workers,
+        "inline": await _run(inline_verify, args.logins),
+        "executor": await _run(pooled_verify, args.logins),
+    }
+    hasher.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
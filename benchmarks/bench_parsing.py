@@ -0,0 +1,94 @@
+# Measures turning a generated timetable into events: parse_ics on its own,
+# and Calendar.fetch_calendar downloading it from a local server and parsing
+# it the way the app does (through the parse pool, bypassing the cache).
+#
+# Usage: python benchmarks/bench_parsing.py [--weeks 12] [--classes-per-week 12]
+#            [--recurring] [--parse-workers 0]
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+from common import summarize, time_calls
+from ics_gen import generate_timetable, semester_end
+
+from modules.ical import (
+    Calendar,
+    calendar_cache,
+    close_session,
+    open_session,
+    parse_ics,
+    parse_pool,
+)
+
+
+async def _time_fetches(body: str, repeats: int) -> dict:
+    async def serve(request: web.Request) -> web.Response:
+        return web.Response(text=body, content_type="text/calendar")
+
+    app = web.Application()
+    app.router.add_get("/timetable.ics", serve)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/timetable.ics"
+
+    await open_session()
+    try:
+        timings = []
+        for _ in range(repeats):
+            calendar_cache.clear()
+            started = time.perf_counter()
+            await Calendar(url).fetch_calendar()
+            timings.append(time.perf_counter() - started)
+    finally:
+        await close_session()
+        await runner.cleanup()
+
+    return summarize(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--classes-per-week", type=int, default=12)
+    parser.add_argument("--recurring", action="store_true")
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    body = generate_timetable(
+        random.Random(args.seed), args.weeks, args.classes_per_week, args.recurring
+    )
+    parse_pool.start(max_workers=args.parse_workers)
+
+    parse, events = time_calls(lambda: parse_ics(body), args.repeats)
+    meetings = len(events.expand(semester_end(args.weeks)))
+    parse["meetings_per_second"] = round(meetings / (parse["median_ms"] / 1000))
+
+    fetch = asyncio.run(_time_fetches(body, args.repeats))
+    parse_pool.shutdown()
+
+    results = {
+        "benchmark": "parsing",
+        "weeks": args.weeks,
+        "classes_per_week": args.classes_per_week,
+        "recurring": args.recurring,
+        "parse_workers": args.parse_workers,
+        "bytes": len(body.encode()),
+        "meetings": meetings,
+        "parse_ics": parse,
+        "fetch_calendar": fetch,
+    }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Measures building and encoding the room sync response for a room of members
+# with a semester of classes each, the way it used to be done (datetimes,
+# member dumps per slot, FastAPI's jsonable_encoder + json.dumps) versus
+# web.room_sync and orjson.
+#
+# Usage: python benchmarks/bench_room_sync.py [--members 10] [--weeks 12]
+#            [--classes-per-week 12] [--recurring]
+
+import argparse
+import json
+import random
+
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+from common import time_calls
+from ics_gen import generate_timetable, semester_end
+
+from models.room_models import RoomDto
+from models.user_models import UserDto
+from modules.availability import compute_free_segments
+from modules.ical import parse_ics
+from modules.ical.snapshots import CalendarStatus, LoadedCalendar
+from web.room_sync import build_room_sync
+from web.windows import EventWindow
+
+
+def legacy_response(room, members, calendars, required_member) -> bytes:
+    users = {}
+    schedules = {}
+    member_intervals = {}
+    for user in members:
+        users[user.id] = user
+        events = calendars[user.id].events
+        schedules[user.id] = {
+            "user": user.model_dump(),
+            "calender_events": [
+                {
+                    "summary": event.summary,
+                    "start_time_iso": event.start_time.timestamp(),
+                    "end_time_iso": event.end_time.timestamp(),
+                    "duration_seconds": event.duration.seconds,
+                }
+                for event in events
+            ],
+        }
+        member_intervals[user.id] = (events.starts, events.ends)
+
+    segments = compute_free_segments(member_intervals)
+    free_times = []
+    for i in range(segments.masks.size):
+        mask = int(segments.masks[i])
+        free = segments.members_of(mask)
+        if len(free) < 2 or required_member not in free:
+            continue
+
+        start_time = datetime.fromtimestamp(int(segments.starts[i]))
+        end_time = datetime.fromtimestamp(int(segments.ends[i]))
+        if start_time.day != end_time.day:
+            continue
+
+        free_times.append(
+            {
+                "summary": "Free time",
+                "start_time_iso": start_time,
+                "end_time_iso": end_time,
+                "duration_seconds": (end_time - start_time).seconds,
+                "free_users": {
+                    user_id: users[user_id].model_dump() for user_id in free
+                },
+            }
+        )
+
+    payload = {
+        "message": "Schedules synced",
+        "room": room.model_dump(),
+        "schedules": schedules,
+        "free_times": free_times,
+    }
+
+    # What FastAPI does with a returned dict.
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def orjson_response(room, members, calendars, required_member) -> bytes:
+    # Calendars are expanded already, so no horizon is needed.
+    window = EventWindow(None, None, horizon=0)
+    payload = build_room_sync(room, members, calendars, window, required_member)
+    return ORJSONResponse(payload).body
+
+
+def _run(build, repeats: int, *args) -> dict:
+    timing, body = time_calls(lambda: build(*args), repeats)
+    return {**timing, "bytes": len(body)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--classes-per-week", type=int, default=12)
+    parser.add_argument("--recurring", action="store_true")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    members = [
+        UserDto(
+            id=f"user-{i}",
+            name=f"Member {i}",
+            email=f"member{i}@example.com",
+            calender_ics_link=f"https://example.com/{i}.ics",
+            preferences="badminton, gaming",
+            hashed_password="$2b$12$" + "x" * 53,
+        )
+        for i in range(args.members)
+    ]
+    calendars = {}
+    for user in members:
+        events = parse_ics(
+            generate_timetable(rng, args.weeks, args.classes_per_week, args.recurring)
+        )
+        # The legacy path only knows single events.
+        events = events.expand(semester_end(args.weeks))
+        calendars[user.id] = LoadedCalendar(events, CalendarStatus.FRESH)
+    room = RoomDto(
+        id="room", name="Study group", room_code="ABC123", owner_id=members[0].id
+    )
+    room.users = [user.id for user in members]
+
+    build_args = (room, members, calendars, members[0].id)
+    legacy = _run(legacy_response, args.repeats, *build_args)
+    fast = _run(orjson_response, args.repeats, *build_args)
+
+    results = {
+        "benchmark": "room_sync",
+        "members": args.members,
+        "weeks": args.weeks,
+        "classes_per_week": args.classes_per_week,
+        "recurring": args.recurring,
+        "events": sum(len(calendar.events) for calendar in calendars.values()),
+        "legacy": legacy,
+        "orjson": fast,
+        "speedup": round(legacy["median_ms"] / fast["median_ms"], 1),
+    }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Measures how long importing the app takes, module by module. This is the
+# part of a cold start before uvicorn can run the lifespan and accept requests.
+# Every run is a fresh interpreter under `python -X importtime`.
+#
+# Usage: python benchmarks/bench_startup.py [--repeats 5] [--top 25]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+FIRST_PARTY = {"main", "config", "models", "modules", "web"}
+
+# Read when the routers are imported. Only needs to be set, not valid.
+PLACEHOLDER_ENV = {"JWT_SECRET_KEY": "bench", "INTERFACE_API_KEY": "bench"}
+
+
+def _import_once(module: str) -> tuple[float, dict[str, tuple[int, int]]]:
+    """Imports `module` in a new interpreter. Returns the wall time and the
+    self and cumulative import time of every module, in microseconds."""
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall_time = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return wall_time, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    wall_times = []
+    runs = []
+    for _ in range(args.repeats):
+        wall_time, modules = _import_once(args.module)
+        wall_times.append(wall_time)
+        runs.append(modules)
+
+    def median_ms(name: str, column: int) -> float:
+        return round(statistics.median(run[name][column] for run in runs) / 1000, 1)
+
+    names = set.intersection(*(set(run) for run in runs))
+    modules = [
+        {
+            "module": name,
+            "self_ms": median_ms(name, 0),
+            "cumulative_ms": median_ms(name, 1),
+            "first_party": name.split(".")[0] in FIRST_PARTY,
+        }
+        for name in names
+    ]
+    modules.sort(key=lambda module: module["cumulative_ms"], reverse=True)
+
+    results = {
+        "benchmark": "startup",
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "repeats": args.repeats,
+        # Includes starting the interpreter itself.
+        "process_ms": round(statistics.median(wall_times) * 1000, 1),
+        "import_ms": median_ms(args.module, 1),
+        "modules_imported": len(names),
+        # Cumulative times of nested imports are also counted in their
+        # importer's, so the heaviest packages show up more than once.
+        "slowest": modules[: args.top],
+        "first_party": [module for module in modules if module["first_party"]],
+    }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
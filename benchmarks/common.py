@@ -0,0 +1,34 @@
+# Helpers shared by the benchmark scripts. Importing this module also makes
+# the app's modules under src importable.
+
+import os
+import statistics
+import sys
+import time
+
+from typing import Callable
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def summarize(timings: list[float]) -> dict:
+    """Timings in seconds, reported in milliseconds."""
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+def time_calls(call: Callable[[], object], repeats: int) -> tuple[dict, object]:
+    """Runs `call` `repeats` times. Returns the timing summary and the last
+    result."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - started)
+
+    return summarize(timings), result
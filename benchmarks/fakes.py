@@ -0,0 +1,455 @@
+# In-process stand-ins for everything the app talks to over the network: the
+# Astra Data API, the SMTP server, the timetable (ICS) hosts and the LLM. Each
+# takes a `Faults` to add latency and fail a share of calls, so the app can be
+# load tested offline under realistic (or bad) conditions.
+
+import asyncio
+import hashlib
+import random
+import uuid
+
+from collections import Counter
+from typing import Callable
+
+import orjson
+
+from aiohttp import web
+
+import common  # noqa: F401 (makes the app importable)
+
+from modules.suggestions import SuggestionBackend
+
+__all__ = [
+    "Faults",
+    "FakeDatabaseError",
+    "FakeCollection",
+    "FakeDatabase",
+    "FakeIcsHost",
+    "FakeSmtpServer",
+    "FakeSuggestionBackend",
+]
+
+
+class Faults:
+    """Latency (uniformly 50% to 150% of `latency_ms`) and failure rate of a
+    fake dependency."""
+
+    def __init__(
+        self, latency_ms: float = 0, failure_rate: float = 0, seed: int | None = None
+    ) -> None:
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    async def wait(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(0.5, 1.5))
+
+    def fails(self) -> bool:
+        return self._rng.random() < self.failure_rate
+
+
+class FakeDatabaseError(Exception):
+    pass
+
+
+class _Result:
+    def __init__(self, count: int = 0, inserted_id: str | None = None) -> None:
+        self.deleted_count = count
+        self.update_info = {"n": count, "updatedExisting": count > 0}
+        self.inserted_id = inserted_id
+
+
+def _copy(document: dict) -> dict:
+    # Documents go through JSON like they would over the Data API, which also
+    # takes the `*Ref` enums as keys.
+    return orjson.loads(orjson.dumps(document, option=orjson.OPT_NON_STR_KEYS))
+
+
+def _matches_value(value, condition) -> bool:
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for operator, argument in condition.items():
+            if operator == "$exists":
+                if (value is not _MISSING) != argument:
+                    return False
+            elif value is _MISSING:
+                return False
+            elif operator == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(item in argument for item in values):
+                    return False
+            elif operator == "$nin":
+                values = value if isinstance(value, list) else [value]
+                if any(item in argument for item in values):
+                    return False
+            elif operator == "$ne":
+                if value == argument:
+                    return False
+            elif operator == "$lt":
+                if not value < argument:
+                    return False
+            elif operator == "$lte":
+                if not value <= argument:
+                    return False
+            elif operator == "$gt":
+                if not value > argument:
+                    return False
+            elif operator == "$gte":
+                if not value >= argument:
+                    return False
+            else:
+                raise FakeDatabaseError(f"Unsupported filter operator {operator}")
+        return True
+
+    # Like the Data API, a value matches arrays containing it.
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+_MISSING = object()
+
+
+def _matches(document: dict, filter: dict) -> bool:
+    return all(
+        _matches_value(document.get(field, _MISSING), condition)
+        for field, condition in filter.items()
+    )
+
+
+def _project(document: dict, projection: dict | None) -> dict:
+    if not projection:
+        return document
+    if any(projection.values()):
+        return {
+            field: value
+            for field, value in document.items()
+            if field == "_id" or projection.get(field)
+        }
+    return {
+        field: value for field, value in document.items() if field not in projection
+    }
+
+
+def _apply(document: dict, update: dict, inserted: bool = False) -> None:
+    for operator, fields in update.items():
+        for field, value in fields.items():
+            if operator == "$setOnInsert":
+                if inserted:
+                    document[field] = value
+            elif operator == "$set":
+                document[field] = value
+            elif operator == "$unset":
+                document.pop(field, None)
+            elif operator == "$inc":
+                document[field] = document.get(field, 0) + value
+            elif operator == "$push":
+                document.setdefault(field, []).append(value)
+            elif operator == "$addToSet":
+                if value not in document.setdefault(field, []):
+                    document[field].append(value)
+            elif operator == "$pull":
+                document[field] = [
+                    item for item in document.get(field, []) if item != value
+                ]
+            else:
+                raise FakeDatabaseError(f"Unsupported update operator {operator}")
+
+
+class _Cursor:
+    def __init__(self, collection: "FakeCollection", filter, projection, sort, limit):
+        self._collection = collection
+        self._filter = filter
+        self._projection = projection
+        self._sort = sort
+        self._limit = limit
+
+    async def _documents(self):
+        await self._collection._io("find")
+        found = [
+            document
+            for document in self._collection.documents.values()
+            if _matches(document, self._filter)
+        ]
+        for field, direction in reversed((self._sort or {}).items()):
+            found.sort(key=lambda document: document[field], reverse=direction < 0)
+        for document in found[: self._limit or None]:
+            yield _project(_copy(document), self._projection)
+
+    def __aiter__(self):
+        return self._documents()
+
+
+class FakeCollection:
+    """Implements the subset of astrapy's `AsyncCollection` the app uses."""
+
+    def __init__(self, name: str, faults: Faults) -> None:
+        self.name = name
+        self.faults = faults
+        self.documents: dict[str, dict] = {}
+        self.operations = Counter()
+
+    def seed(self, documents: list[dict]) -> None:
+        """Stores documents straight away, without latency or failures."""
+        for document in documents:
+            self.documents[document["_id"]] = _copy(document)
+
+    async def _io(self, operation: str) -> None:
+        self.operations[operation] += 1
+        await self.faults.wait()
+        if self.faults.fails():
+            raise FakeDatabaseError(f"Injected failure of {operation} on {self.name}")
+
+    def _first(self, filter: dict) -> dict | None:
+        for document in self.documents.values():
+            if _matches(document, filter):
+                return document
+        return None
+
+    def find(
+        self,
+        filter: dict | None = None,
+        *,
+        projection=None,
+        sort=None,
+        limit=None,
+        **_,
+    ):
+        return _Cursor(self, filter or {}, projection, sort, limit)
+
+    async def find_one(self, filter: dict, *, projection=None, **_) -> dict | None:
+        await self._io("find_one")
+        document = self._first(filter)
+        return None if document is None else _project(_copy(document), projection)
+
+    async def find_one_and_update(
+        self, filter: dict, update: dict, *, projection=None, **_
+    ) -> dict | None:
+        await self._io("find_one_and_update")
+        document = self._first(filter)
+        if document is None:
+            return None
+        before = _copy(document)
+        _apply(document, _copy(update))
+        return _project(before, projection)
+
+    async def insert_one(self, document: dict, **_) -> _Result:
+        await self._io("insert_one")
+        document = _copy(document)
+        document.setdefault("_id", str(uuid.uuid4()))
+        if document["_id"] in self.documents:
+            raise FakeDatabaseError(f"Document {document['_id']} already exists")
+        self.documents[document["_id"]] = document
+        return _Result(1, document["_id"])
+
+    async def update_one(
+        self, filter: dict, update: dict, *, upsert: bool = False, **_
+    ) -> _Result:
+        await self._io("update_one")
+        document = self._first(filter)
+        inserted = document is None
+        if inserted:
+            if not upsert:
+                return _Result(0)
+            document = {
+                field: value
+                for field, value in filter.items()
+                if not isinstance(value, dict)
+            }
+            document.setdefault("_id", str(uuid.uuid4()))
+            self.documents[document["_id"]] = document
+        _apply(document, _copy(update), inserted)
+        return _Result(1)
+
+    async def update_many(self, filter: dict, update: dict, **_) -> _Result:
+        await self._io("update_many")
+        found = [d for d in self.documents.values() if _matches(d, filter)]
+        for document in found:
+            _apply(document, _copy(update))
+        return _Result(len(found))
+
+    async def replace_one(
+        self, filter: dict, replacement: dict, *, upsert: bool = False, **_
+    ) -> _Result:
+        await self._io("replace_one")
+        document = self._first(filter)
+        if document is None and not upsert:
+            return _Result(0)
+
+        replacement = _copy(replacement)
+        if document is not None:
+            replacement["_id"] = document["_id"]
+        replacement.setdefault("_id", filter.get("_id", str(uuid.uuid4())))
+        self.documents[replacement["_id"]] = replacement
+        return _Result(1)
+
+    async def delete_one(self, filter: dict, **_) -> _Result:
+        await self._io("delete_one")
+        document = self._first(filter)
+        if document is None:
+            return _Result(0)
+        del self.documents[document["_id"]]
+        return _Result(1)
+
+    async def delete_many(self, filter: dict, **_) -> _Result:
+        await self._io("delete_many")
+        found = [d["_id"] for d in self.documents.values() if _matches(d, filter)]
+        for document_id in found:
+            del self.documents[document_id]
+        return _Result(len(found))
+
+
+class FakeDatabase:
+    """Stand-in for astrapy's `AsyncDatabase`, see `Database.attach`. Every
+    collection shares the same faults."""
+
+    def __init__(self, faults: Faults | None = None) -> None:
+        self.faults = faults or Faults()
+        self.collections: dict[str, FakeCollection] = {}
+
+    async def get_collection(self, name: str, **_) -> FakeCollection:
+        return self.collection(name)
+
+    async def create_collection(self, name: str, **_) -> FakeCollection:
+        return self.collection(name)
+
+    def collection(self, name: str) -> FakeCollection:
+        name = str(name)
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self.faults)
+        return self.collections[name]
+
+    def stats(self) -> dict:
+        return {
+            name: dict(collection.operations)
+            for name, collection in self.collections.items()
+        }
+
+
+class FakeIcsHost:
+    """Serves a timetable per name at `/ics/{name}.ics`, with ETags so
+    revalidations get a 304. Failures answer 503."""
+
+    def __init__(
+        self, timetable: Callable[[str], str], faults: Faults | None = None
+    ) -> None:
+        self.faults = faults or Faults()
+        self._timetable = timetable
+        self._bodies: dict[str, tuple[str, str]] = {}
+        self._runner: web.AppRunner | None = None
+        self.base_url: str | None = None
+        self.requests = Counter()
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/ics/{name}.ics"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        app = web.Application()
+        app.router.add_get("/ics/{name}.ics", self._serve)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _serve(self, request: web.Request) -> web.Response:
+        await self.faults.wait()
+        if self.faults.fails():
+            self.requests["failed"] += 1
+            return web.Response(status=503)
+
+        name = request.match_info["name"]
+        if name not in self._bodies:
+            body = self._timetable(name)
+            self._bodies[name] = (body, hashlib.sha256(body.encode()).hexdigest())
+        body, etag = self._bodies[name]
+
+        if request.headers.get("If-None-Match") == f'"{etag}"':
+            self.requests["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        self.requests["ok"] += 1
+        return web.Response(
+            text=body, content_type="text/calendar", headers={"ETag": f'"{etag}"'}
+        )
+
+
+class FakeSmtpServer:
+    """Accepts mail over plain SMTP without authentication and drops it.
+    Failures reject the message with a 451 after its data was sent."""
+
+    def __init__(self, faults: Faults | None = None) -> None:
+        self.faults = faults or Faults()
+        self._server: asyncio.Server | None = None
+        self.port: int | None = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._session, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _session(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        def reply(line: str) -> None:
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 fake-smtp ready")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip().upper()
+                if command.startswith("EHLO"):
+                    reply("250-fake-smtp")
+                    reply("250 8BITMIME")
+                elif command.startswith("DATA"):
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    await self.faults.wait()
+                    if self.faults.fails():
+                        self.rejected += 1
+                        reply("451 4.3.0 Try again later")
+                    else:
+                        self.received += 1
+                        reply("250 2.0.0 Queued")
+                elif command.startswith("QUIT"):
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    # HELO, MAIL, RCPT, RSET, NOOP.
+                    reply("250 OK")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class FakeSuggestionBackend(SuggestionBackend):
+    """Answers like the LLM would, after its latency. Failures raise."""
+
+    def __init__(self, faults: Faults | None = None) -> None:
+        self.faults = faults or Faults()
+        self.calls = 0
+
+    async def suggest(self, interests: list[str], event_time: str) -> str:
+        self.calls += 1
+        await self.faults.wait()
+        if self.faults.fails():
+            raise RuntimeError("Injected suggestion backend failure")
+
+        return '"The Arcade" at the sports facility - billiards and air hockey'
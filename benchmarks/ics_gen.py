@@ -0,0 +1,150 @@
+# Generates synthetic Allocate+ style timetables. Each class meets weekly at a
+# random weekday and hour between 8:00 and 18:00 Melbourne time, with a
+# mid-semester break after week 6. Like Allocate+, every meeting is its own
+# VEVENT, or with `recurring` every class is one weekly RRULE event with the
+# break as an EXDATE.
+#
+# Usage: python benchmarks/ics_gen.py [--weeks 12] [--classes-per-week 12]
+#            [--recurring] [--seed 0] > timetable.ics
+
+import argparse
+import random
+
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+SEMESTER_START = date(2025, 3, 3)
+TZID = "Australia/Melbourne"
+UNITS = ["FIT1045", "FIT1047", "MAT1830", "ENG1005", "FIT2004", "FIT3171"]
+KINDS = ["Lecture", "Tutorial", "Workshop", "Applied", "Laboratory"]
+BUILDINGS = ["CL_20Chn", "CL_14Rnf", "CL_25Exh", "CL_16Rnf", "CL_Woodside"]
+
+# Meetings in the week after week 6 are skipped.
+BREAK_AFTER_WEEK = 6
+
+VTIMEZONE = """BEGIN:VTIMEZONE
+TZID:Australia/Melbourne
+BEGIN:STANDARD
+DTSTART:19700405T030000
+RRULE:FREQ=YEARLY;BYMONTH=4;BYDAY=1SU
+TZOFFSETFROM:+1100
+TZOFFSETTO:+1000
+TZNAME:AEST
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:19701004T020000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=1SU
+TZOFFSETFROM:+1000
+TZOFFSETTO:+1100
+TZNAME:AEDT
+END:DAYLIGHT
+END:VTIMEZONE"""
+
+
+def _local(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _class_slots(
+    rng: random.Random, classes_per_week: int
+) -> list[tuple[str, int, int, int, str]]:
+    """(summary, weekday, hour, hours, location) of every weekly class."""
+    free_slots = [(weekday, hour) for weekday in range(5) for hour in range(8, 17)]
+    classes = []
+    for i, (weekday, hour) in enumerate(rng.sample(free_slots, classes_per_week)):
+        unit = rng.choice(UNITS)
+        kind = rng.choice(KINDS)
+        location = f"{rng.choice(BUILDINGS)}/G{rng.randint(1, 60):02d}"
+        classes.append(
+            (
+                f"{unit} {kind} {i % 4 + 1:02d}",
+                weekday,
+                hour,
+                rng.choice((1, 2)),
+                location,
+            )
+        )
+
+    return classes
+
+
+def generate_timetable(
+    rng: random.Random,
+    weeks: int = 12,
+    classes_per_week: int = 12,
+    recurring: bool = False,
+    start: date = SEMESTER_START,
+) -> str:
+    """One student's timetable for a semester of `weeks` teaching weeks."""
+    # Teaching weeks plus the break.
+    weeks_spanned = weeks + (1 if weeks > BREAK_AFTER_WEEK else 0)
+    stamp = _local(datetime(start.year, 1, 1))
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Allocate+//Timetable//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        VTIMEZONE,
+    ]
+    for i, (summary, weekday, hour, hours, location) in enumerate(
+        _class_slots(rng, classes_per_week)
+    ):
+        first = datetime.combine(start, datetime.min.time()) + timedelta(
+            days=weekday, hours=hour
+        )
+        meetings = [
+            first + timedelta(weeks=week)
+            for week in range(weeks_spanned)
+            if week != BREAK_AFTER_WEEK
+        ]
+        if recurring:
+            meetings = meetings[:1]
+
+        for meeting in meetings:
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{_local(meeting)}-{i:02d}@allocate.example",
+                f"DTSTAMP:{stamp}Z",
+                f"SUMMARY:{summary}",
+                f"LOCATION:{location}",
+                f"DESCRIPTION:{summary}, {location}",
+                f"DTSTART;TZID={TZID}:{_local(meeting)}",
+                f"DTEND;TZID={TZID}:{_local(meeting + timedelta(hours=hours))}",
+            ]
+            if recurring:
+                lines.append(f"RRULE:FREQ=WEEKLY;COUNT={weeks_spanned}")
+                if weeks_spanned > weeks:
+                    skipped = meeting + timedelta(weeks=BREAK_AFTER_WEEK)
+                    lines.append(f"EXDATE;TZID={TZID}:{_local(skipped)}")
+            lines.append("END:VEVENT")
+
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def semester_end(weeks: int, start: date = SEMESTER_START) -> int:
+    """Epoch seconds after the last meeting of a generated timetable."""
+    weeks_spanned = weeks + (1 if weeks > BREAK_AFTER_WEEK else 0)
+    end = datetime.combine(start, datetime.min.time(), ZoneInfo(TZID))
+    return int((end + timedelta(weeks=weeks_spanned)).timestamp())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--classes-per-week", type=int, default=12)
+    parser.add_argument("--recurring", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(
+        generate_timetable(rng, args.weeks, args.classes_per_week, args.recurring),
+        end="",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,584 @@
+# Load tests the whole app offline. `serve` runs it under uvicorn with the
+# stand-ins from fakes.py in place of Astra, the SMTP server, the timetable
+# hosts and the LLM, seeded with a deterministic population of users and
+# rooms. `run` starts such a server (or targets --url), sends a weighted mix
+# of requests at --rps with Poisson arrivals for --duration seconds and
+# prints p50/p95/p99 latency and throughput per route as JSON.
+#
+# Latencies count from when a request was due, not when it was sent, so a
+# server falling behind shows up as latency instead of lowering the offered
+# load. At most --max-in-flight requests are outstanding, arrivals beyond
+# that are dropped and counted.
+#
+# Usage: python benchmarks/load_test.py run [--rps 50] [--duration 30]
+#            [--mix login=1,join=1,sync=4,suggest=1,register=0.5]
+#            [--db-latency-ms 5] [--db-failure-rate 0] ...
+#        python benchmarks/load_test.py serve [--port 8000] ...
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import jwt
+
+import common  # noqa: F401 (makes the app importable)
+
+from ics_gen import SEMESTER_START, generate_timetable
+
+JWT_SECRET = "load-test-secret"
+API_KEY = "load-test-api-key"
+PASSWORD = "load-test-password"
+INTERESTS = ["badminton", "gaming", "basketball", "gym", "walking", "billiards"]
+
+ROUTES = {
+    "login": "POST /token",
+    "join": "POST /rooms/{room_code}/join",
+    "leave": "POST /rooms/{room_id}/leave",
+    "sync": "GET /rooms/{room_id}/calenders",
+    "suggest": "GET /rooms/preference",
+    "register": "POST /users/",
+}
+DEFAULT_MIX = "login=1,join=1,sync=4,suggest=1,register=0.5"
+
+# Every (name, default latency in ms) of a stand-in with --<name>-latency-ms
+# and --<name>-failure-rate arguments.
+STAND_INS = {"db": 5, "ics": 50, "smtp": 20, "llm": 300}
+
+
+def build_population(users: int, rooms: int, members: int) -> dict:
+    """Users, rooms and the users in no room, named by index so `serve` and
+    `run` agree on them without talking."""
+    if rooms * members >= users:
+        raise SystemExit("--users must be larger than --rooms * --members")
+
+    return {
+        "users": [
+            {"id": f"user-{i}", "email": f"user{i}@example.com"} for i in range(users)
+        ],
+        "rooms": [
+            {
+                "id": f"room-{i}",
+                "room_code": f"{i:06d}",
+                "users": [f"user-{i * members + j}" for j in range(members)],
+            }
+            for i in range(rooms)
+        ],
+        "joiners": [f"user-{i}" for i in range(rooms * members, users)],
+    }
+
+
+def _add_population_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--members", type=int, default=5)
+
+
+def _add_stand_in_args(parser: argparse.ArgumentParser) -> None:
+    for name, latency_ms in STAND_INS.items():
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency_ms)
+        parser.add_argument(f"--{name}-failure-rate", type=float, default=0)
+
+
+def _stand_in_argv(args: argparse.Namespace) -> list[str]:
+    argv = []
+    for name in STAND_INS:
+        argv += [
+            f"--{name}-latency-ms",
+            str(getattr(args, f"{name}_latency_ms")),
+            f"--{name}-failure-rate",
+            str(getattr(args, f"{name}_failure_rate")),
+        ]
+
+    return argv
+
+
+def serve(args: argparse.Namespace) -> None:
+    # Read when the app is imported.
+    os.environ["JWT_SECRET_KEY"] = JWT_SECRET
+    os.environ["INTERFACE_API_KEY"] = API_KEY
+
+    import uvicorn
+
+    from fastapi_mail import ConnectionConfig
+    from passlib.context import CryptContext
+
+    from fakes import (
+        FakeDatabase,
+        FakeIcsHost,
+        FakeSmtpServer,
+        FakeSuggestionBackend,
+        Faults,
+    )
+
+    import config
+    from main import app
+    from modules.db import CollectionRef, database
+    from modules.mail import mail_outbox
+    from modules.suggestions import suggestion_service
+
+    def faults(name: str) -> Faults:
+        return Faults(
+            getattr(args, f"{name}_latency_ms"),
+            getattr(args, f"{name}_failure_rate"),
+            seed=args.seed,
+        )
+
+    # The LLM stand-in replaces the stub once the app configured it.
+    config.app_config.suggestions.backend = "stub"
+    config.app_config.passwords.bcrypt_rounds = args.bcrypt_rounds
+
+    population = build_population(args.users, args.rooms, args.members)
+    db = FakeDatabase(faults("db"))
+    ics_host = FakeIcsHost(
+        lambda name: generate_timetable(
+            random.Random(f"{args.seed}-{name}"), args.weeks, args.classes_per_week
+        ),
+        faults("ics"),
+    )
+    smtp = FakeSmtpServer(faults("smtp"))
+    llm = FakeSuggestionBackend(faults("llm"))
+
+    # All users share one hash so seeding does not take minutes.
+    hashed_password = CryptContext(
+        schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds
+    ).hash(PASSWORD)
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await ics_host.start()
+        await smtp.start()
+
+        rng = random.Random(args.seed)
+        db.collection(CollectionRef.USERS).seed(
+            [
+                {
+                    "_id": user["id"],
+                    "name": f"Load Test {user['id']}",
+                    "email": user["email"],
+                    "calender_ics_link": ics_host.url(user["id"]),
+                    "preferences": ", ".join(rng.sample(INTERESTS, 2)),
+                    "hashed_password": hashed_password,
+                    "account_verified": True,
+                    "disabled": False,
+                }
+                for user in population["users"]
+            ]
+        )
+        db.collection(CollectionRef.ROOMS).seed(
+            [
+                {
+                    "_id": room["id"],
+                    "name": f"Load Test {room['id']}",
+                    "room_code": room["room_code"],
+                    "owner_id": room["users"][0],
+                    "users": room["users"],
+                }
+                for room in population["rooms"]
+            ]
+        )
+        await database.attach(db, name="load-test")
+        mail_outbox.configure(
+            ConnectionConfig(
+                MAIL_USERNAME="",
+                MAIL_PASSWORD="",
+                MAIL_FROM="noreply@example.com",
+                MAIL_PORT=smtp.port,
+                MAIL_SERVER="127.0.0.1",
+                MAIL_STARTTLS=False,
+                MAIL_SSL_TLS=False,
+                USE_CREDENTIALS=False,
+                VALIDATE_CERTS=False,
+            )
+        )
+
+        async with app_lifespan(app):
+            suggestion_service.configure(backend=llm)
+            yield
+
+        await ics_host.stop()
+        await smtp.stop()
+
+        # Read by `run` for its report.
+        stats = {
+            "db_operations": db.stats(),
+            "ics_requests": dict(ics_host.requests),
+            "mail_received": smtp.received,
+            "mail_rejected": smtp.rejected,
+            "llm_calls": llm.calls,
+        }
+        print(json.dumps(stats), flush=True)
+
+    app.router.lifespan_context = lifespan
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+def _percentile(latencies: list[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted latencies, in milliseconds."""
+    index = max(0, -(-len(latencies) * percent // 100) - 1)
+    return round(latencies[int(index)] * 1000, 2)
+
+
+class Recorder:
+    """Outcomes per route of the requests due after the warmup."""
+
+    def __init__(self, measure_from: float) -> None:
+        self.measure_from = measure_from
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route: str, due: float, status: int | None) -> None:
+        if due < self.measure_from:
+            return
+
+        if status is None or status >= 500:
+            outcome = "errors"
+        elif status >= 400:
+            outcome = "rejected"
+        else:
+            outcome = "ok"
+        self.outcomes[route][outcome] += 1
+        self.latencies[route].append(time.perf_counter() - due)
+
+    def dropped(self, route: str, due: float) -> None:
+        if due >= self.measure_from:
+            self.outcomes[route]["dropped"] += 1
+
+    def report(self, seconds: float) -> dict:
+        report = {}
+        for route in ROUTES:
+            latencies = sorted(self.latencies[route])
+            outcomes = self.outcomes[route]
+            if not latencies and not outcomes:
+                continue
+
+            report[ROUTES[route]] = {
+                "requests": len(latencies),
+                "ok": outcomes["ok"],
+                "rejected": outcomes["rejected"],
+                "errors": outcomes["errors"],
+                "dropped": outcomes["dropped"],
+                "throughput_rps": round(outcomes["ok"] / seconds, 2),
+            }
+            if latencies:
+                report[ROUTES[route]].update(
+                    p50_ms=_percentile(latencies, 50),
+                    p95_ms=_percentile(latencies, 95),
+                    p99_ms=_percentile(latencies, 99),
+                    max_ms=round(latencies[-1] * 1000, 2),
+                )
+
+        return report
+
+
+class Traffic:
+    """Sends one request of every kind in the mix as the population's users."""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        population: dict,
+        recorder: Recorder,
+        rng: random.Random,
+    ) -> None:
+        self.session = session
+        self.url = url
+        self.population = population
+        self.recorder = recorder
+        self.rng = rng
+        self.registered = 0
+
+        # Users in no room join one and leave it again, one request each at
+        # a time so their joins are never rejected as already in the room.
+        self.joiners = asyncio.Queue()
+        for user_id in population["joiners"]:
+            self.joiners.put_nowait(user_id)
+
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        self.tokens = {
+            user["id"]: jwt.encode(
+                {"sub": user["id"], "exp": expires}, JWT_SECRET, algorithm="HS256"
+            )
+            for user in population["users"]
+        }
+
+        start = datetime.combine(SEMESTER_START, datetime.min.time())
+        self.window = {
+            "from": start.isoformat(),
+            "to": (start + timedelta(weeks=1)).isoformat(),
+        }
+
+    def _auth(self, user_id: str) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    async def _send(self, route: str, due: float, method: str, path: str, **kwargs):
+        try:
+            async with self.session.request(method, self.url + path, **kwargs) as r:
+                await r.read()
+                status = r.status
+        except aiohttp.ClientError:
+            status = None
+
+        self.recorder.record(route, due, status)
+        return status
+
+    async def login(self, due: float) -> None:
+        user = self.rng.choice(self.population["users"])
+        await self._send(
+            "login",
+            due,
+            "POST",
+            "/token",
+            data={"username": user["email"], "password": PASSWORD},
+        )
+
+    async def join(self, due: float) -> None:
+        user_id = await self.joiners.get()
+        room = self.rng.choice(self.population["rooms"])
+        try:
+            status = await self._send(
+                "join",
+                due,
+                "POST",
+                f"/rooms/{room['room_code']}/join",
+                headers=self._auth(user_id),
+            )
+            if status == 200:
+                await self._send(
+                    "leave",
+                    time.perf_counter(),
+                    "POST",
+                    f"/rooms/{room['id']}/leave",
+                    headers=self._auth(user_id),
+                )
+        finally:
+            self.joiners.put_nowait(user_id)
+
+    async def sync(self, due: float) -> None:
+        room = self.rng.choice(self.population["rooms"])
+        await self._send(
+            "sync",
+            due,
+            "GET",
+            f"/rooms/{room['id']}/calenders",
+            params=self.window,
+            headers=self._auth(self.rng.choice(room["users"])),
+        )
+
+    async def suggest(self, due: float) -> None:
+        room = self.rng.choice(self.population["rooms"])
+        event_time = datetime.combine(SEMESTER_START, datetime.min.time())
+        event_time += timedelta(
+            days=self.rng.randrange(5), hours=self.rng.randrange(8, 18)
+        )
+        await self._send(
+            "suggest",
+            due,
+            "GET",
+            "/rooms/preference",
+            params=[("user_ids", user_id) for user_id in room["users"]]
+            + [("event_time", event_time.isoformat())],
+        )
+
+    async def register(self, due: float) -> None:
+        self.registered += 1
+        email = f"new-{os.getpid()}-{self.registered}@example.com"
+        await self._send(
+            "register",
+            due,
+            "POST",
+            "/users/",
+            json={"name": "Load Test", "email": email},
+            headers={"Authorization": API_KEY},
+        )
+
+
+def _parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES or name == "leave":
+            raise SystemExit(f"Unknown request kind {name!r} in --mix")
+        weights[name] = float(weight or 1)
+
+    return weights
+
+
+async def drive(args: argparse.Namespace, url: str) -> dict:
+    population = build_population(args.users, args.rooms, args.members)
+    mix = _parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    recorder = Recorder(started + args.warmup)
+    ends_at = recorder.measure_from + args.duration
+    in_flight: set[asyncio.Task] = set()
+
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        traffic = Traffic(session, url, population, recorder, rng)
+        kinds, weights = list(mix), list(mix.values())
+
+        due = started
+        while True:
+            due += rng.expovariate(args.rps)
+            if due >= ends_at:
+                break
+            await asyncio.sleep(max(0, due - time.perf_counter()))
+
+            kind = rng.choices(kinds, weights)[0]
+            if len(in_flight) >= args.max_in_flight:
+                recorder.dropped(kind, due)
+                continue
+
+            task = asyncio.create_task(getattr(traffic, kind)(due))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        await asyncio.gather(*in_flight)
+        seconds = time.perf_counter() - recorder.measure_from
+
+    completed = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "rps": args.rps,
+        "achieved_rps": round(completed / seconds, 2),
+        "seconds": round(seconds, 2),
+        "routes": recorder.report(seconds),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(args: argparse.Namespace, log) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "serve",
+            "--port",
+            str(port),
+            "--users",
+            str(args.users),
+            "--rooms",
+            str(args.rooms),
+            "--members",
+            str(args.members),
+            "--bcrypt-rounds",
+            str(args.bcrypt_rounds),
+            "--seed",
+            str(args.seed),
+            *_stand_in_argv(args),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=log,
+        text=True,
+    )
+
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def _wait_until_healthy(url: str, server: subprocess.Popen | None) -> None:
+    deadline = time.monotonic() + 60
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise RuntimeError("Server exited before becoming healthy")
+            try:
+                async with session.get(url + "/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+
+    raise RuntimeError(f"{url} did not become healthy within 60 seconds")
+
+
+def run(args: argparse.Namespace) -> None:
+    server = None
+    url = args.url
+    with tempfile.TemporaryFile("w+") as log:
+        if url is None:
+            server, url = _start_server(args, log)
+
+        try:
+            asyncio.run(_wait_until_healthy(url, server))
+            results = asyncio.run(drive(args, url))
+        except BaseException:
+            if server is not None:
+                server.kill()
+                log.seek(0)
+                print(log.read()[-4000:], file=sys.stderr)
+            raise
+
+        results = {"benchmark": "load_test", "mix": _parse_mix(args.mix), **results}
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            stdout, _ = server.communicate(timeout=60)
+            results["stand_ins"] = json.loads(stdout.strip().splitlines()[-1])
+            results["stand_ins"]["settings"] = {
+                name: {
+                    "latency_ms": getattr(args, f"{name}_latency_ms"),
+                    "failure_rate": getattr(args, f"{name}_failure_rate"),
+                }
+                for name in STAND_INS
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--log-level", default="warning")
+    serve_parser.add_argument("--weeks", type=int, default=12)
+    serve_parser.add_argument("--classes-per-week", type=int, default=12)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--url", help="Load test a running server instead")
+    run_parser.add_argument("--rps", type=float, default=50)
+    run_parser.add_argument("--duration", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=5)
+    run_parser.add_argument("--mix", default=DEFAULT_MIX)
+    run_parser.add_argument("--max-in-flight", type=int, default=256)
+
+    for command_parser in (serve_parser, run_parser):
+        _add_population_args(command_parser)
+        _add_stand_in_args(command_parser)
+        # Lower than the app's 12 rounds so logins do not dominate.
+        command_parser.add_argument("--bcrypt-rounds", type=int, default=8)
+        command_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Runs every benchmark with its defaults and writes their results, along with
+# the commit and interpreter they ran on, as one JSON document. Give a previous
+# document with --compare to also print how every median changed.
+#
+# Usage: python benchmarks/run_all.py [--output results.json]
+#            [--compare old.json] [--only parsing free_times ...]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Script per benchmark name, and extra runs with non-default arguments.
+BENCHMARKS = {
+    "parsing": ["bench_parsing.py"],
+    "parsing_recurring": ["bench_parsing.py", "--recurring"],
+    "free_times": ["bench_free_times.py"],
+    "free_times_recurring": ["bench_free_times.py", "--recurring"],
+    "room_sync": ["bench_room_sync.py"],
+    "login": ["bench_login.py"],
+    "startup": ["bench_startup.py"],
+}
+
+
+def _git_commit() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=BENCHMARKS_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or None
+
+
+def _medians(results: dict, prefix: str = "") -> dict[str, float]:
+    """Every `median_ms` in a result, keyed by its path."""
+    medians = {}
+    for key, value in results.items():
+        if key == "median_ms":
+            medians[prefix.rstrip(".")] = value
+        elif isinstance(value, dict):
+            medians.update(_medians(value, f"{prefix}{key}."))
+
+    return medians
+
+
+def compare(old: dict, new: dict) -> None:
+    old_medians = _medians(old["results"])
+    for path, median in _medians(new["results"]).items():
+        if path not in old_medians:
+            continue
+        change = (median - old_medians[path]) / old_medians[path] * 100
+        print(
+            f"{path:45} {old_medians[path]:10.2f} -> {median:10.2f} ms "
+            f"({change:+.1f}%)",
+            file=sys.stderr,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    args = parser.parse_args()
+
+    results = {}
+    for name, command in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+
+        print(f"Running {name}", file=sys.stderr)
+        result = subprocess.run(
+            [sys.executable, os.path.join(BENCHMARKS_DIR, command[0]), *command[1:]],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            sys.exit(f"{name} failed:\n{result.stderr[-2000:]}")
+        results[name] = json.loads(result.stdout)
+
+    document = {
+        "commit": _git_commit(),
+        "ran_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), document)
+
+
+if __name__ == "__main__":
+    main()
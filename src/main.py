@@ -3,20 +3,160 @@ import logging
 import os
 import yaml
 
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from typing import TYPE_CHECKING
 
 import config
-from modules.db import get_db
+from models.config_models import AppConfigDto
+from modules.db import CalendarRef, CollectionRef, database
+from modules.ical import calendar_cache, close_session, open_session, parse_pool
+from modules.ical.snapshots import snapshot_refresher
+from modules.loop_monitor import loop_monitor
+from modules.mail import mail_outbox
+from modules.memberships import backfill_memberships
+from modules.passwords import password_hasher
+from modules.profiling import request_profiler
+from modules.suggestions import create_backend, suggestion_service
+from web.metrics import MetricsMiddleware
+from web.profiling import ProfilingMiddleware
 
 if TYPE_CHECKING:
     from fastapi import APIRouter
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # First, so anything blocking the loop from here on is reported.
+    loop_monitor_config = config.app_config.loop_monitor
+    if loop_monitor_config.enabled:
+        loop_monitor.configure(
+            interval=loop_monitor_config.interval_seconds,
+            threshold=loop_monitor_config.block_threshold_seconds,
+            max_frames=loop_monitor_config.max_stack_frames,
+        )
+        await loop_monitor.start()
+
+    # A database attached beforehand (e.g. a local stand-in) is kept.
+    if not database.connected:
+        await database.connect(
+            os.getenv("ASTRA_DB_APPLICATION_ENDPOINT"),
+            warm_connections=config.app_config.database.warm_connections,
+        )
+
+    calendar_config = config.app_config.calendar
+    calendar_cache.configure(
+        ttl=calendar_config.cache_ttl_seconds,
+        max_entries=calendar_config.cache_max_entries,
+    )
+    parse_pool.start(
+        max_workers=calendar_config.parse_workers,
+        inline_max_bytes=calendar_config.parse_inline_max_bytes,
+    )
+
+    # Imported here since web.user_auth reads its secrets when imported, which
+    # must happen after load_dotenv.
+    from web.user_auth import principal_cache
+
+    auth_config = config.app_config.auth
+    principal_cache.configure(
+        ttl=auth_config.principal_cache_ttl_seconds,
+        max_entries=auth_config.principal_cache_max_entries,
+    )
+
+    passwords_config = config.app_config.passwords
+    password_hasher.configure(
+        rounds=passwords_config.bcrypt_rounds,
+        max_workers=passwords_config.hash_workers,
+        max_queue=passwords_config.hash_max_queue,
+    )
+
+    suggestions_config = config.app_config.suggestions
+    suggestion_service.configure(
+        backend=create_backend(
+            suggestions_config.backend,
+            api_key=os.getenv("GROQ_API_KEY"),
+            model=suggestions_config.model,
+        ),
+        ttl=suggestions_config.cache_ttl_seconds,
+        max_entries=suggestions_config.cache_max_entries,
+        bucket_minutes=suggestions_config.event_time_bucket_minutes,
+    )
+
+    # Idempotent, makes sure collections added after launch exist.
+    await database.create_collection(
+        CollectionRef.CALENDARS,
+        indexing={"deny": [CalendarRef.EVENTS]},
+        check_exists=False,
+    )
+    membership_collection = await database.create_collection(
+        CollectionRef.MEMBERSHIPS, check_exists=False
+    )
+    membership_backfill = config.app_config.database.membership_backfill
+    if membership_backfill == "always" or (
+        membership_backfill == "if_empty"
+        and await membership_collection.find_one({}, projection={"_id": True}) is None
+    ):
+        await backfill_memberships(database)
+
+    profiling_config = config.app_config.profiling
+    request_profiler.configure(
+        enabled=profiling_config.enabled,
+        interval=profiling_config.sample_interval_seconds,
+        max_duration=profiling_config.max_duration_seconds,
+        max_profiles=profiling_config.max_profiles,
+    )
+
+    http_config = config.app_config.http
+    await open_session(
+        limit=http_config.connection_limit,
+        limit_per_host=http_config.connection_limit_per_host,
+        keepalive_timeout=http_config.keepalive_timeout_seconds,
+        dns_cache_ttl=http_config.dns_cache_ttl_seconds,
+    )
+    _log.info("Opened shared HTTP session")
+
+    snapshots_config = config.app_config.snapshots
+    await snapshot_refresher.start(
+        refresh_interval=snapshots_config.refresh_interval_seconds,
+        poll_interval=snapshots_config.poll_interval_seconds,
+        batch_size=snapshots_config.batch_size,
+        max_concurrency=snapshots_config.max_concurrency,
+        per_host_concurrency=snapshots_config.per_host_concurrency,
+        backoff_base=snapshots_config.backoff_base_seconds,
+        backoff_max=snapshots_config.backoff_max_seconds,
+        jitter=snapshots_config.jitter,
+        fetch_timeout=snapshots_config.fetch_timeout_seconds,
+        stale_after=snapshots_config.stale_after_seconds,
+    )
+
+    mail_config = config.app_config.mail
+    await mail_outbox.start(
+        workers=mail_config.outbox_workers,
+        batch_size=mail_config.outbox_batch_size,
+        max_attempts=mail_config.outbox_max_attempts,
+        retry_backoff=mail_config.outbox_retry_backoff_seconds,
+        idle_timeout=mail_config.outbox_idle_timeout_seconds,
+        persist=mail_config.outbox_persist,
+    )
+
+    yield
+
+    await mail_outbox.stop(timeout=mail_config.outbox_drain_timeout_seconds)
+    await snapshot_refresher.stop()
+    await close_session()
+    _log.info("Closed shared HTTP session")
+    parse_pool.shutdown()
+    password_hasher.shutdown()
+    await database.close()
+    await loop_monitor.stop()
+
+
 # FastAPI requires a global variable named 'app' to be defined as the FastAPI
 # instance.
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 config.app = app
 _log = logging.getLogger("uvicorn")
 load_dotenv()
@@ -28,11 +168,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 APP_CONFIG_DIR = os.path.join(BASE_DIR, "configs", "app_config.yaml")
-ROUTERS_DIR = os.path.join(BASE_DIR, "web", "routers")
+
+# Every router the app serves, included in this order. Add new ones here.
+ROUTERS = (
+    "web.routers.health_routes",
+    "web.routers.metrics_routes",
+    "web.routers.profile_routes",
+    "web.routers.auth_routes",
+    "web.routers.user_routes",
+    "web.routers.preferences_routes",
+    "web.routers.calender_routes",
+    "web.routers.room_routes",
+    "web.routers.mail_routes",
+)
 
 
 def _get_config() -> None:
@@ -42,25 +196,15 @@ def _get_config() -> None:
         )
 
     with open(APP_CONFIG_DIR, "r") as f:
-        config.app_config = yaml.safe_load(f)
+        config.app_config = AppConfigDto.model_validate(yaml.safe_load(f) or {})
 
 
 def _import_routers() -> None:
-    for filename in os.listdir(ROUTERS_DIR):
-        if not filename.endswith(".py"):
-            continue
-
-        relative_dir = ROUTERS_DIR.replace(BASE_DIR, "")[1:]
-
-        module_path = relative_dir.replace(os.path.sep, ".") + "." + filename[:-3]
-
+    for module_path in ROUTERS:
         module = importlib.import_module(module_path)
-        if hasattr(module, "router"):
-            router: APIRouter = getattr(module, "router")
-            app.include_router(router)
-            _log.info(f"Included router: {filename[:-3]}")
-        else:
-            _log.warning(f"Router {filename} does not have a router object")
+        router: APIRouter = module.router
+        app.include_router(router)
+        _log.info(f"Included router: {module_path.rsplit('.', 1)[1]}")
 
 
 # Don't use if __name__ == "__main__": here.
@@ -69,6 +213,4 @@ _log.setLevel(logging.DEBUG)
 _get_config()
 _import_routers()
 
-config.db = get_db(os.getenv("ASTRA_DB_APPLICATION_ENDPOINT"))
-
 _log.info("App initialized")
@@ -0,0 +1,38 @@
+# Chuck in anything related to stored calendars here.
+# e.g. The parsed snapshot of a user's timetable
+
+from pydantic import BaseModel
+from .generic import DBRecord
+from typing import Optional, List
+
+
+class SnapshotRecurrenceDto(BaseModel):
+    summary_id: int
+    start: str  # ISO 8601 with the UTC offset of the first occurrence
+    tzid: Optional[str] = None  # Zone the rule is expanded in, if named
+    duration: int  # Seconds
+    rule: str  # RRULE value, e.g. FREQ=WEEKLY;COUNT=12
+    exdates: List[int] = []  # Unix times of skipped occurrences
+
+
+class SnapshotEventsDto(BaseModel):
+    # Columns of equal length, one entry per event. Summaries repeat a lot in
+    # timetables, so every distinct one is stored once and referenced by index.
+    summaries: List[str] = []
+    summary_ids: List[int] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    recurrences: List[SnapshotRecurrenceDto] = []
+
+
+class CalendarSnapshotDto(DBRecord):
+    id: Optional[str] = None  # Same as the owning user's id
+    calender_ics_link: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None  # SHA-256 of the ICS body
+    fetched_at: float  # Unix time
+    # Refresh bookkeeping. Failed refreshes back off exponentially.
+    next_refresh_at: float = 0  # Unix time
+    failures: int = 0
+    events: SnapshotEventsDto = SnapshotEventsDto()
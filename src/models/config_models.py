@@ -1,5 +1,140 @@
 from pydantic import BaseModel
+from typing import Literal
+
+
+class CalendarConfigDto(BaseModel):
+    # How long a fetched timetable is served without asking upstream again.
+    cache_ttl_seconds: int = 900
+    # Maximum number of ICS URLs kept in the process-wide calendar cache.
+    cache_max_entries: int = 512
+    # Worker processes used to parse ICS bodies. 0 parses in a thread instead.
+    parse_workers: int = 2
+    # Bodies up to this size are parsed inline on the event loop.
+    parse_inline_max_bytes: int = 16384
+    # How long saving a calendar may take to download and parse it.
+    validation_timeout_seconds: float = 10
+    # Room and user calendar views wait at most this long for calendars that
+    # have to be fetched live, and serve the rest as missing.
+    sync_deadline_seconds: float = 3
+    # A live fetch still running after this long is raced by a second request.
+    hedge_after_seconds: float = 1
+    # Length of the window when a request only gives `from` or `to`, and the
+    # longest window a request may ask for.
+    default_window_days: int = 7
+    max_window_days: int = 366
+    # Without a window, recurring events are expanded this far from now.
+    recurrence_horizon_days: int = 180
+
+
+class SnapshotsConfigDto(BaseModel):
+    # Stored timetables are re-fetched in the background after this long.
+    # Keep it above calendar.cache_ttl_seconds.
+    refresh_interval_seconds: float = 21600
+    # How often the refresher looks for due snapshots, and how many it takes.
+    poll_interval_seconds: float = 60
+    batch_size: int = 50
+    # Concurrent refreshes overall and per timetable server.
+    max_concurrency: int = 8
+    per_host_concurrency: int = 2
+    # Failing calendars are retried after this long, doubling up to the max.
+    backoff_base_seconds: float = 300
+    backoff_max_seconds: float = 86400
+    # Every delay is randomly stretched or shrunk by up to this fraction.
+    jitter: float = 0.1
+    fetch_timeout_seconds: float = 30
+    # Snapshots older than this, or whose last refresh failed, are served
+    # marked as stale.
+    stale_after_seconds: float = 43200
+
+
+class HttpConfigDto(BaseModel):
+    # Connection pool of the shared session used for outbound calendar fetches.
+    connection_limit: int = 100
+    connection_limit_per_host: int = 20
+    keepalive_timeout_seconds: float = 30
+    dns_cache_ttl_seconds: int = 300
+
+
+class DatabaseConfigDto(BaseModel):
+    # Connections opened to each of the users and rooms collections on startup.
+    warm_connections: int = 4
+    # How long /health waits for the database before reporting it down.
+    health_timeout_seconds: float = 2
+    # When to add room memberships missing for the rooms' members on startup:
+    # if there are none yet (e.g. the first start after they were added),
+    # always (to repair them after failed writes) or never.
+    membership_backfill: Literal["if_empty", "always", "never"] = "if_empty"
+
+
+class AuthConfigDto(BaseModel):
+    # How long an authenticated user is served from memory instead of the DB.
+    # Writes made by another process become visible after at most this long.
+    principal_cache_ttl_seconds: float = 30
+    principal_cache_max_entries: int = 10000
+
+
+class PasswordsConfigDto(BaseModel):
+    bcrypt_rounds: int = 12
+    # Threads hashing concurrently, and how many more hashes may wait for one
+    # before new logins are turned away with a 503.
+    hash_workers: int = 4
+    hash_max_queue: int = 64
+
+
+class SuggestionsConfigDto(BaseModel):
+    # "groq" (needs GROQ_API_KEY) or "stub" for local runs without network.
+    backend: str = "groq"
+    model: str = "llama-3.3-70b-versatile"
+    cache_ttl_seconds: int = 3600
+    cache_max_entries: int = 1024
+    # Event times are rounded down to this many minutes before caching.
+    event_time_bucket_minutes: int = 60
+
+
+class MailConfigDto(BaseModel):
+    outbox_workers: int = 1
+    # Queued mails sent over one SMTP connection per worker wake-up.
+    outbox_batch_size: int = 20
+    outbox_max_attempts: int = 5
+    # Seconds before the first retry, doubling with every further attempt.
+    outbox_retry_backoff_seconds: float = 2.0
+    # An idle worker closes its SMTP connection after this long.
+    outbox_idle_timeout_seconds: float = 30.0
+    # Store queued mail in the DB so it survives restarts. Only enable with a
+    # single dyno, every process re-queues the whole outbox on start.
+    outbox_persist: bool = False
+    # Seconds given to the outbox to drain on shutdown.
+    outbox_drain_timeout_seconds: float = 10.0
+
+
+class LoopMonitorConfigDto(BaseModel):
+    enabled: bool = True
+    # How often the event loop is probed for lag. Keep well below the threshold.
+    interval_seconds: float = 0.05
+    # Blocks of the event loop longer than this are logged with their stack.
+    block_threshold_seconds: float = 0.1
+    # Innermost frames of the blocking stack kept in the log.
+    max_stack_frames: int = 20
+
+
+class ProfilingConfigDto(BaseModel):
+    # Whether requests sending the API key in X-Profile-Key are profiled.
+    enabled: bool = True
+    sample_interval_seconds: float = 0.005
+    # Sampling stops after this long, e.g. for long streams.
+    max_duration_seconds: float = 60
+    # Only the latest profiles are kept, in memory.
+    max_profiles: int = 20
 
 
 class AppConfigDto(BaseModel):
-    pass
+    calendar: CalendarConfigDto = CalendarConfigDto()
+    snapshots: SnapshotsConfigDto = SnapshotsConfigDto()
+    http: HttpConfigDto = HttpConfigDto()
+    database: DatabaseConfigDto = DatabaseConfigDto()
+    auth: AuthConfigDto = AuthConfigDto()
+    passwords: PasswordsConfigDto = PasswordsConfigDto()
+    suggestions: SuggestionsConfigDto = SuggestionsConfigDto()
+    mail: MailConfigDto = MailConfigDto()
+    loop_monitor: LoopMonitorConfigDto = LoopMonitorConfigDto()
+    profiling: ProfilingConfigDto = ProfilingConfigDto()
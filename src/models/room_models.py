@@ -11,3 +11,11 @@ class RoomDto(DBRecord):
     room_code: Optional[str] = None
     owner_id: Optional[str] = None
     users: List[str] = []
+
+
+class RoomSummaryDto(DBRecord):
+    id: str
+    name: str
+    room_code: Optional[str] = None
+    owner_id: Optional[str] = None
+    member_count: int = 0
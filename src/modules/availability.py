@@ -0,0 +1,160 @@
+# Finds the times when members of a room are free together.
+#
+# Every member's events are reduced to sorted, merged busy intervals held in
+# int64 epoch-second arrays. The union of all interval edges splits the room's
+# time span into segments, and each segment gets a bitmask of the members that
+# are free during it (bit i set = member_ids[i] is free).
+
+import time
+import numpy as np
+
+from typing import Mapping
+
+__all__ = [
+    "FreeSegments",
+    "merge_intervals",
+    "compute_free_segments",
+    "find_free_times",
+]
+
+MAX_MEMBERS = 64  # One bit per member in a uint64 mask.
+
+Intervals = tuple[np.ndarray, np.ndarray]
+
+
+def merge_intervals(starts: np.ndarray, ends: np.ndarray) -> Intervals:
+    """Merges overlapping or touching intervals. Returns sorted start/end
+    arrays of the merged intervals."""
+    if starts.size == 0:
+        return starts.astype(np.int64), ends.astype(np.int64)
+
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = ends[order]
+
+    # An interval opens a new group when it starts after every earlier
+    # interval has ended.
+    running_end = np.maximum.accumulate(ends)
+    new_group = np.empty(starts.size, dtype=bool)
+    new_group[0] = True
+    new_group[1:] = starts[1:] > running_end[:-1]
+
+    group_index = np.flatnonzero(new_group)
+
+    return starts[group_index], np.maximum.reduceat(ends, group_index)
+
+
+class FreeSegments:
+    """Consecutive segments `[starts[i], ends[i])` of a room's time span with
+    the bitmask of free members for each."""
+
+    def __init__(
+        self,
+        member_ids: list[str],
+        starts: np.ndarray,
+        ends: np.ndarray,
+        masks: np.ndarray,
+    ) -> None:
+        self.member_ids = member_ids
+        self.starts = starts
+        self.ends = ends
+        self.masks = masks
+
+    def member_bit(self, member_id: str) -> np.uint64:
+        return np.uint64(1) << np.uint64(self.member_ids.index(member_id))
+
+    def members_of(self, mask: int) -> list[str]:
+        return [
+            member_id for i, member_id in enumerate(self.member_ids) if mask >> i & 1
+        ]
+
+
+def compute_free_segments(member_intervals: Mapping[str, Intervals]) -> FreeSegments:
+    member_ids = list(member_intervals)
+    if len(member_ids) > MAX_MEMBERS:
+        raise ValueError(
+            f"Cannot compute free times for more than {MAX_MEMBERS} members"
+        )
+
+    merged = [merge_intervals(*member_intervals[member_id]) for member_id in member_ids]
+
+    empty = np.empty(0, dtype=np.int64)
+    boundaries = np.unique(
+        np.concatenate([empty] + [edges for interval in merged for edges in interval])
+    )
+    if boundaries.size < 2:
+        return FreeSegments(member_ids, empty, empty, np.empty(0, dtype=np.uint64))
+
+    segment_starts = boundaries[:-1]
+    segment_ends = boundaries[1:]
+
+    masks = np.zeros(segment_starts.size, dtype=np.uint64)
+    for bit, (busy_starts, busy_ends) in enumerate(merged):
+        if busy_starts.size == 0:
+            masks |= np.uint64(1) << np.uint64(bit)
+            continue
+
+        # Segments never straddle an interval edge, so checking where each
+        # segment starts is enough.
+        index = np.searchsorted(busy_starts, segment_starts, side="right") - 1
+        busy = (index >= 0) & (busy_ends[np.maximum(index, 0)] > segment_starts)
+        masks |= (~busy).astype(np.uint64) << np.uint64(bit)
+
+    return FreeSegments(member_ids, segment_starts, segment_ends, masks)
+
+
+def _local_dates(timestamps: np.ndarray) -> list[tuple[int, int, int]]:
+    return [time.localtime(timestamp)[:3] for timestamp in timestamps.tolist()]
+
+
+def find_free_times(
+    member_intervals: Mapping[str, Intervals],
+    required_member: str,
+    min_free_members: int = 2,
+    window: tuple[int, int] | None = None,
+) -> list[dict]:
+    """Free slots shared by at least `min_free_members` members, including
+    `required_member`, that start and end on the same (local) day. With a
+    `window`, only slots inside it are considered.
+
+    Times are epoch seconds and `free_users` lists member IDs, so the result
+    can be serialized as is.
+    """
+    if required_member not in member_intervals:
+        return []
+
+    if window is not None:
+        member_intervals = {
+            member_id: (np.clip(starts, *window), np.clip(ends, *window))
+            for member_id, (starts, ends) in member_intervals.items()
+        }
+
+    segments = compute_free_segments(member_intervals)
+    if segments.masks.size == 0:
+        return []
+
+    required_bit = segments.member_bit(required_member)
+    candidates = np.flatnonzero(
+        (np.bitwise_count(segments.masks) >= min_free_members)
+        & ((segments.masks & required_bit) != 0)
+    )
+    starts = segments.starts[candidates]
+    ends = segments.ends[candidates]
+
+    return [
+        {
+            "summary": "Free time",
+            "start_time_iso": start,
+            "end_time_iso": end,
+            "duration_seconds": end - start,
+            "free_users": segments.members_of(mask),
+        }
+        for start, end, mask, start_date, end_date in zip(
+            starts.tolist(),
+            ends.tolist(),
+            segments.masks[candidates].tolist(),
+            _local_dates(starts),
+            _local_dates(ends),
+        )
+        if start_date == end_date
+    ]
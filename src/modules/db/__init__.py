@@ -1,24 +1,18 @@
-import os
-import logging
-
-from astrapy import DataAPIClient, AsyncDatabase
-
+from .calendars import CalendarRef
 from .collections import CollectionRef
+from .database import Database, DatabaseUnavailableError, database, get_database
 from .users import UserRef
 from .rooms import RoomRef
-
-__all__ = ["get_db", "UserRef", "CollectionRef", "RoomRef"]
-
-_log = logging.getLogger("uvicorn")
-
-
-def get_db(endpoint: str, token: str = None) -> AsyncDatabase:
-    token = token if token is not None else os.getenv("ASTRA_DB_APPLICATION_TOKEN")
-
-    client = DataAPIClient(token)
-
-    db = client.get_async_database(endpoint)
-
-    _log.info(f"Connected to database {db.info().name}")
-
-    return db
+from .memberships import MembershipRef
+
+__all__ = [
+    "Database",
+    "DatabaseUnavailableError",
+    "database",
+    "get_database",
+    "UserRef",
+    "CollectionRef",
+    "RoomRef",
+    "MembershipRef",
+    "CalendarRef",
+]
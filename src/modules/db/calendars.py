@@ -0,0 +1,13 @@
+from enum import StrEnum
+
+
+class CalendarRef(StrEnum):
+    ID = "_id"
+    CALENDER_ICS_LINK = "calender_ics_link"
+    ETAG = "etag"
+    LAST_MODIFIED = "last_modified"
+    CONTENT_HASH = "content_hash"
+    FETCHED_AT = "fetched_at"
+    NEXT_REFRESH_AT = "next_refresh_at"
+    FAILURES = "failures"
+    EVENTS = "events"
@@ -4,3 +4,6 @@ from enum import StrEnum
 class CollectionRef(StrEnum):
     USERS = "users"
     ROOMS = "rooms"
+    MEMBERSHIPS = "room_memberships"
+    CALENDARS = "calendars"
+    MAIL_OUTBOX = "mail_outbox"
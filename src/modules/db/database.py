@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+
+from typing import TYPE_CHECKING
+
+from .collections import CollectionRef
+from .instrumented import InstrumentedCollection
+
+if TYPE_CHECKING:
+    from astrapy import AsyncDatabase
+
+__all__ = ["Database", "DatabaseUnavailableError", "database", "get_database"]
+
+_log = logging.getLogger("uvicorn")
+
+
+class DatabaseUnavailableError(RuntimeError):
+    pass
+
+
+class Database:
+    """The app's Astra DB connection, opened once by the lifespan.
+
+    Every collection handle is resolved when connecting and reused afterwards.
+    Each astrapy collection keeps its own HTTP connection pool, so a fresh
+    handle per request also meant a fresh TLS connection per request.
+
+    Anything with async `get_collection` and `create_collection` methods can
+    be attached instead of a real database, e.g. a local stand-in.
+
+    Handles are wrapped in `InstrumentedCollection`, so every call is counted
+    and timed in the database metrics.
+    """
+
+    def __init__(self) -> None:
+        self._db: AsyncDatabase | None = None
+        self._collections: dict[CollectionRef, InstrumentedCollection] = {}
+
+        self.name: str | None = None
+        self.checked_at: float | None = None
+        self.latency: float | None = None
+        self.error: str | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._db is not None
+
+    async def connect(
+        self,
+        endpoint: str,
+        token: str = None,
+        warm_connections: int = 4,
+    ) -> None:
+        token = token if token is not None else os.getenv("ASTRA_DB_APPLICATION_TOKEN")
+
+        # Imported here, astrapy takes a good part of the app's import time.
+        from astrapy import DataAPIClient
+
+        db = DataAPIClient(token).get_async_database(endpoint)
+        # Goes through the DevOps API with a blocking client.
+        info = await asyncio.to_thread(db.info)
+        await self.attach(db, name=info.name)
+        await self.warm_up(warm_connections)
+
+        _log.info(f"Connected to database {self.name}")
+
+    async def attach(self, db: AsyncDatabase, name: str | None = None) -> None:
+        """Uses `db` from now on, resolving every collection handle."""
+        self._db = db
+        self._collections = {
+            ref: InstrumentedCollection(ref, await db.get_collection(ref))
+            for ref in CollectionRef
+        }
+        self.name = name
+
+    async def create_collection(
+        self, ref: CollectionRef, **options
+    ) -> InstrumentedCollection:
+        """Creates the collection if needed and caches the returned handle."""
+        collection = await self._database().create_collection(ref, **options)
+        self._collections[ref] = InstrumentedCollection(ref, collection)
+        return self._collections[ref]
+
+    def collection(self, ref: CollectionRef) -> InstrumentedCollection:
+        self._database()
+        return self._collections[ref]
+
+    async def warm_up(self, connections: int) -> None:
+        """Opens `connections` connections to the users and rooms collections
+        so the first requests do not pay for the TLS handshakes."""
+        if connections <= 0:
+            return
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self.collection(ref).find_one({}, projection={"_id": True})
+                for ref in (CollectionRef.USERS, CollectionRef.ROOMS)
+                for _ in range(connections)
+            ),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            _log.warning(f"Could not warm up database connections: {errors[0]!r}")
+        else:
+            _log.info(
+                f"Warmed up database connections in "
+                f"{time.perf_counter() - started:.2f}s"
+            )
+
+    async def health(self, timeout: float = 2) -> dict:
+        """Checks the database answers with a round trip to the users
+        collection."""
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                await self.collection(CollectionRef.USERS).find_one(
+                    {}, projection={"_id": True}
+                )
+        except Exception as e:
+            self.error = repr(e)
+            self.latency = None
+        else:
+            self.error = None
+            self.latency = time.perf_counter() - started
+        self.checked_at = time.time()
+
+        latency_ms = None
+        if self.latency is not None:
+            latency_ms = round(self.latency * 1000, 1)
+
+        return {
+            "status": "down" if self.error else "ok",
+            "database": self.name,
+            "latency_ms": latency_ms,
+            "checked_at": self.checked_at,
+            "error": self.error,
+        }
+
+    async def close(self) -> None:
+        # Closes the HTTP clients of astrapy's handles, stand-ins have none.
+        handles = [collection.wrapped for collection in self._collections.values()]
+        for handle in (*handles, self._db):
+            if hasattr(handle, "__aexit__"):
+                await handle.__aexit__(None, None, None)
+
+        self._collections = {}
+        self._db = None
+
+    def _database(self) -> AsyncDatabase:
+        if self._db is None:
+            raise DatabaseUnavailableError("Database is not connected")
+        return self._db
+
+
+database = Database()
+
+
+def get_database() -> Database:
+    """FastAPI dependency for the database. Auth, the loaders, snapshots and
+    the mail outbox use the module-level `database` directly, so swapping it
+    for another is done with `database.attach()`, not by overriding this."""
+    return database
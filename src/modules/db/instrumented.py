@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import time
+
+from typing import TYPE_CHECKING
+
+from modules.metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from astrapy import AsyncCollection
+
+__all__ = ["InstrumentedCollection"]
+
+db_operations = Counter(
+    "db_operations_total",
+    "Database calls by collection, operation and outcome (ok or error).",
+    ("collection", "operation", "outcome"),
+)
+db_operation_seconds = Histogram(
+    "db_operation_duration_seconds",
+    "Time spent in database calls by collection and operation.",
+    ("collection", "operation"),
+    span="db",
+)
+
+
+def _record(collection: str, operation: str, outcome: str, seconds: float) -> None:
+    db_operations.inc(collection=collection, operation=operation, outcome=outcome)
+    db_operation_seconds.observe(seconds, collection=collection, operation=operation)
+
+
+class _InstrumentedCursor:
+    """Times only the waits for documents, not what the caller does between
+    them. Recorded once the cursor is exhausted or fails."""
+
+    def __init__(self, collection: str, cursor) -> None:
+        self._collection = collection
+        self._cursor = cursor
+        self._iterator = None
+        self._seconds = 0.0
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    def __aiter__(self) -> _InstrumentedCursor:
+        self._iterator = self._cursor.__aiter__()
+        return self
+
+    async def __anext__(self) -> dict:
+        started = time.perf_counter()
+        try:
+            document = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._seconds += time.perf_counter() - started
+            _record(self._collection, "find", "ok", self._seconds)
+            raise
+        except Exception:
+            self._seconds += time.perf_counter() - started
+            _record(self._collection, "find", "error", self._seconds)
+            raise
+
+        self._seconds += time.perf_counter() - started
+        return document
+
+
+class InstrumentedCollection:
+    """Counts and times every call the app makes on a collection handle.
+    Anything else is passed through to the handle as is."""
+
+    def __init__(self, name: str, collection: AsyncCollection) -> None:
+        self.name = name
+        self.wrapped = collection
+
+    def __getattr__(self, name: str):
+        return getattr(self.wrapped, name)
+
+    async def _call(self, operation: str, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await getattr(self.wrapped, operation)(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            _record(self.name, operation, outcome, time.perf_counter() - started)
+
+    def find(self, *args, **kwargs) -> _InstrumentedCursor:
+        return _InstrumentedCursor(self.name, self.wrapped.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return await self._call("find_one", *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._call("find_one_and_update", *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._call("insert_one", *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._call("update_one", *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._call("update_many", *args, **kwargs)
+
+    async def replace_one(self, *args, **kwargs):
+        return await self._call("replace_one", *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._call("delete_one", *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._call("delete_many", *args, **kwargs)
@@ -0,0 +1,8 @@
+from enum import StrEnum
+
+
+class MembershipRef(StrEnum):
+    ID = "_id"
+    ROOM_ID = "room_id"
+    USER_ID = "user_id"
+    JOINED_AT = "joined_at"
@@ -0,0 +1,25 @@
+from .cache import CachedCalendar, CalendarCache, calendar_cache
+from .calendar import Calendar, CalendarFetchError
+from .flight import SingleFlight, fetch_flight
+from .parsing import ParsePool, parse_ics, parse_pool
+from .session import client_session, close_session, open_session
+from .store import Event, EventStore, Recurrence
+
+__all__ = [
+    "Calendar",
+    "CalendarFetchError",
+    "Event",
+    "EventStore",
+    "Recurrence",
+    "CachedCalendar",
+    "CalendarCache",
+    "calendar_cache",
+    "SingleFlight",
+    "fetch_flight",
+    "ParsePool",
+    "parse_ics",
+    "parse_pool",
+    "open_session",
+    "close_session",
+    "client_session",
+]
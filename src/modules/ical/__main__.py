@@ -0,0 +1,16 @@
+import asyncio
+
+from .calendar import Calendar
+
+
+async def main():
+    calendar_url = "https://my-timetable.monash.edu/odd/rest/calendar/ical/c392fe27-66ce-4992-ba42-09f18e2ea455"
+
+    cal = Calendar(calendar_url)
+    await cal.fetch_calendar()
+    for event in cal.events:
+        print(event.summary)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
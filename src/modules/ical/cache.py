@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import time
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from modules.metrics import Counter, Gauge
+
+if TYPE_CHECKING:
+    from .store import EventStore
+
+__all__ = ["CachedCalendar", "CalendarCache", "calendar_cache"]
+
+DEFAULT_TTL_SECONDS = 900
+DEFAULT_MAX_ENTRIES = 512
+
+calendar_cache_lookups = Counter(
+    "calendar_cache_lookups_total",
+    "Calendar cache lookups by result: hit if the entry could be served as is, "
+    "else miss (including stale entries kept to revalidate).",
+    ("result",),
+)
+calendar_cache_entries = Gauge(
+    "calendar_cache_entries",
+    "Parsed calendars held in the process-wide calendar cache.",
+)
+calendar_cache_evictions = Counter(
+    "calendar_cache_evictions_total",
+    "Calendars dropped from the cache to stay within its maximum size.",
+)
+
+
+class CachedCalendar:
+    """Parsed events of one ICS feed plus the validators needed to revalidate
+    it with a conditional GET, and the SHA-256 of the body they came from."""
+
+    __slots__ = ("events", "etag", "last_modified", "content_hash", "fetched_at")
+
+    def __init__(
+        self,
+        events: EventStore,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        content_hash: str | None = None,
+        age: float = 0,
+    ) -> None:
+        self.events = events
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.fetched_at = time.monotonic() - age
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.monotonic() - self.fetched_at < ttl
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+class CalendarCache:
+    """Process-wide LRU cache of parsed calendars keyed by ICS URL.
+
+    Entries younger than `ttl` seconds are served without touching the network.
+    Older entries are kept so their `ETag`/`Last-Modified` can be sent on the
+    refresh; a 304 from upstream then only renews the entry.
+    """
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES
+    ) -> None:
+        self._entries: OrderedDict[str, CachedCalendar] = OrderedDict()
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def configure(
+        self, ttl: float | None = None, max_entries: int | None = None
+    ) -> None:
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+            self._evict()
+
+    def get(self, url: str) -> CachedCalendar | None:
+        """Returns the entry for `url`, fresh or not, and records a hit only if
+        it can be served as is."""
+        entry = self._entries.get(url)
+        if entry is None:
+            calendar_cache_lookups.inc(result="miss")
+            return None
+
+        self._entries.move_to_end(url)
+        if entry.is_fresh(self.ttl):
+            calendar_cache_lookups.inc(result="hit")
+        else:
+            calendar_cache_lookups.inc(result="miss")
+
+        return entry
+
+    def peek(self, url: str) -> CachedCalendar | None:
+        """Returns the entry for `url` without counting or reordering it."""
+        return self._entries.get(url)
+
+    def put(
+        self,
+        url: str,
+        events: EventStore,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        content_hash: str | None = None,
+        age: float = 0,
+    ) -> CachedCalendar:
+        """Stores freshly parsed events. `age` backdates entries restored from
+        elsewhere (e.g. a stored snapshot) by that many seconds."""
+        entry = CachedCalendar(events, etag, last_modified, content_hash, age)
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        self._evict()
+
+        return entry
+
+    def revalidate(self, url: str) -> CachedCalendar | None:
+        """Marks the entry as fresh again after upstream answered 304."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            entry.fetched_at = time.monotonic()
+
+        return entry
+
+    def invalidate(self, url: str) -> None:
+        self._entries.pop(url, None)
+        calendar_cache_entries.set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        calendar_cache_entries.set(0)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            calendar_cache_evictions.inc()
+        calendar_cache_entries.set(len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._entries
+
+
+calendar_cache = CalendarCache()
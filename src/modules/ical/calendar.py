@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import aiohttp
+import aiohttp.client_exceptions
+
+from typing import Mapping
+
+from modules.metrics import Counter, Histogram
+
+from .cache import CachedCalendar, calendar_cache
+from .flight import fetch_flight
+from .parsing import parse_pool
+from .session import client_session
+from .store import EventStore
+
+
+class CalendarFetchError(ValueError):
+    """The calendar could not be downloaded or is not a valid ICS file."""
+
+
+calendar_fetches = Counter(
+    "calendar_fetches_total",
+    "Calendar fetches by result: cached, not_modified, unchanged, parsed or error.",
+    ("result",),
+)
+calendar_download_seconds = Histogram(
+    "calendar_download_duration_seconds",
+    "Time spent downloading calendars, including hedged requests.",
+    span="ics",
+)
+calendar_download_bytes = Histogram(
+    "calendar_download_size_bytes",
+    "Size of the calendar bodies downloaded.",
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+calendar_parse_seconds = Histogram(
+    "calendar_parse_duration_seconds",
+    "Time spent parsing calendars, including waiting for a parse worker.",
+    span="parse",
+)
+
+
+async def _get(
+    url: str, headers: dict[str, str]
+) -> tuple[int, Mapping[str, str], str | None]:
+    """Status, headers and (for a 200) body of a GET."""
+    async with client_session() as session:
+        async with session.get(url, headers=headers) as resp:
+            body = await resp.text() if resp.status == 200 else None
+            return resp.status, resp.headers.copy(), body
+
+
+async def _hedged_get(
+    url: str, headers: dict[str, str], hedge_after: float | None
+) -> tuple[int, Mapping[str, str], str | None]:
+    """Like `_get`, but sends a second identical request if the first has not
+    finished after `hedge_after` seconds and returns whichever succeeds
+    first. Errors only surface once both requests have failed."""
+    first = asyncio.ensure_future(_get(url, headers))
+    if hedge_after is None:
+        return await first
+
+    attempts = {first}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        if not done:
+            attempts.add(asyncio.ensure_future(_get(url, headers)))
+
+        while True:
+            done, attempts = await asyncio.wait(
+                attempts, return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+            if not attempts:
+                return done.pop().result()
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+async def _download(
+    url: str, cached: CachedCalendar | None, hedge_after: float | None = None
+) -> CachedCalendar:
+    """Gets and parses `url`, revalidating `cached` if given, and stores the
+    result in the calendar cache."""
+    headers = cached.conditional_headers() if cached is not None else {}
+    try:
+        with calendar_download_seconds.time():
+            status, resp_headers, body = await _hedged_get(url, headers, hedge_after)
+        if status == 304 and cached is not None:
+            calendar_fetches.inc(result="not_modified")
+            # Could have been evicted while waiting for upstream.
+            return calendar_cache.revalidate(url) or cached
+        elif status != 200:
+            raise CalendarFetchError(f"Could not get calendar, HTTP Error {status}")
+
+        encoded = body.encode()
+        calendar_download_bytes.observe(len(encoded))
+        content_hash = hashlib.sha256(encoded).hexdigest()
+        if cached is not None and cached.content_hash == content_hash:
+            calendar_fetches.inc(result="unchanged")
+            return calendar_cache.revalidate(url) or cached
+
+        with calendar_parse_seconds.time():
+            events = await parse_pool.parse(body)
+    except aiohttp.client_exceptions.InvalidUrlClientError:
+        calendar_fetches.inc(result="error")
+        raise
+    except aiohttp.ClientError as e:
+        calendar_fetches.inc(result="error")
+        raise CalendarFetchError(f"Could not get calendar, {e}") from e
+    except CalendarFetchError:
+        calendar_fetches.inc(result="error")
+        raise
+    except ValueError as e:
+        calendar_fetches.inc(result="error")
+        raise CalendarFetchError(f"Calendar is not a valid ICS file, {e}") from e
+
+    calendar_fetches.inc(result="parsed")
+    return calendar_cache.put(
+        url,
+        events,
+        etag=resp_headers.get("ETag"),
+        last_modified=resp_headers.get("Last-Modified"),
+        content_hash=content_hash,
+    )
+
+
+class Calendar:
+    def __init__(self, URL: str) -> None:
+        """Initialises the Calendar class with the URL"""
+        self._URL = URL
+        self.events = EventStore.empty()
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.content_hash: str | None = None
+
+    @property
+    def url(self) -> str:
+        return self._URL
+
+    async def fetch_calendar(
+        self,
+        timeout: float | None = None,
+        max_age: float | None = None,
+        hedge_after: float | None = None,
+    ) -> bool:
+        """Gets the calendar, going through the process-wide calendar cache.
+
+        Fresh cache entries are used as is. Stale ones are revalidated with a
+        conditional GET and only re-parsed if upstream sends a different body,
+        which is also checked by hash for servers that never answer 304.
+        Concurrent calls for the same URL share one download and parse.
+
+        `max_age` lowers the cache TTL for this call, e.g. to only accept
+        entries fetched after some point. With `hedge_after`, a download still
+        running after that many seconds is raced by a second request.
+
+        Returns False if the URL is not a valid URL at all and raises
+        `CalendarFetchError` if it does not lead to a calendar within
+        `timeout` seconds.
+        """
+        ttl = calendar_cache.ttl
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+
+        cached = calendar_cache.get(self._URL)
+        if cached is not None and cached.is_fresh(ttl):
+            calendar_fetches.inc(result="cached")
+            self._use(cached)
+            return True
+
+        try:
+            async with asyncio.timeout(timeout):
+                # Requests for the same URL made meanwhile share this download.
+                cached = await fetch_flight.do(
+                    self._URL, lambda: _download(self._URL, cached, hedge_after)
+                )
+        except aiohttp.client_exceptions.InvalidUrlClientError:
+            return False
+        except TimeoutError as e:
+            raise CalendarFetchError(f"Timed out getting calendar {self._URL}") from e
+
+        self._use(cached)
+        return True
+
+    def _use(self, cached: CachedCalendar) -> None:
+        self.events = cached.events
+        self.etag = cached.etag
+        self.last_modified = cached.last_modified
+        self.content_hash = cached.content_hash
@@ -0,0 +1,59 @@
+import asyncio
+
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from modules.metrics import Counter
+
+__all__ = ["SingleFlight", "fetch_flight"]
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time. Callers asking for a key that is
+    already in flight wait for that call and all get its result (or error).
+
+    The call runs as its own task, so a caller giving up (e.g. on a timeout)
+    does not cancel it for the others, and its result still lands wherever
+    the call puts it. Callers joining a call in flight are counted in
+    `coalesced` if given.
+    """
+
+    def __init__(self, coalesced: Counter | None = None) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._coalesced = coalesced
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            if self._coalesced is not None:
+                self._coalesced.inc()
+        else:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marks the error as retrieved in case every caller gave up on it.
+        if not task.cancelled():
+            task.exception()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+# Downloads of ICS feeds, keyed by URL.
+fetch_flight = SingleFlight(
+    coalesced=Counter(
+        "calendar_fetch_coalesced_total",
+        "Calendar fetches that joined a download of the same URL already in "
+        "flight instead of starting their own.",
+    )
+)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+from .store import EventStore, Recurrence
+
+if TYPE_CHECKING:
+    import icalendar
+
+__all__ = ["ParsePool", "parse_ics", "parse_pool"]
+
+_log = logging.getLogger("uvicorn")
+
+DEFAULT_INLINE_MAX_BYTES = 16_384
+
+
+def _to_datetime(value: date | datetime) -> datetime:
+    # All-day events only carry a date.
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, time.min)
+
+
+def _with_named_zone(value: datetime) -> datetime:
+    """Recurrences are expanded in their start's zone, which has to survive
+    pickling and snapshots, so zones are either zoneinfo zones or fixed."""
+    tzinfo = value.tzinfo
+    if tzinfo is None or hasattr(tzinfo, "key"):
+        return value
+
+    zone = getattr(tzinfo, "zone", None)  # pytz
+    if zone is not None:
+        return value.replace(tzinfo=ZoneInfo(zone))
+
+    return value.replace(tzinfo=timezone(value.utcoffset()))
+
+
+def _exdates(event: icalendar.Event) -> list[int]:
+    exdates = event.get("EXDATE", [])
+    if not isinstance(exdates, list):
+        exdates = [exdates]
+
+    return [
+        int(_to_datetime(exdate.dt).timestamp())
+        for exdates_line in exdates
+        for exdate in exdates_line.dts
+    ]
+
+
+def load_parser() -> None:
+    """Imports the ICS parser ahead of the first parse."""
+    import icalendar  # noqa: F401
+
+
+def parse_ics(body: str) -> EventStore:
+    """Parses an ICS body into an `EventStore`.
+
+    Runs inside the worker processes, so it has to stay a top-level function.
+    The store pickles as a handful of arrays, which keeps sending it back cheap.
+
+    Events with an RRULE become `Recurrence`s and are not expanded here.
+    Instances that were moved (sent as their own event with a RECURRENCE-ID)
+    are dropped from their recurrence and kept as normal events.
+    """
+    # https://icalendar.readthedocs.io/en/latest/
+    # Imported on first use, see `load_parser`.
+    import icalendar
+
+    calendar = icalendar.Calendar.from_ical(body)
+
+    summary_index: dict[str, int] = {}
+    starts = []
+    ends = []
+    summary_ids = []
+    recurring = []
+    moved: dict[str, list[int]] = {}
+    for event in calendar.events:
+        start_time = _to_datetime(event.get("DTSTART").dt)
+        if "DTEND" in event:
+            end_time = _to_datetime(event.get("DTEND").dt)
+        else:
+            end_time = start_time + (event.duration or timedelta())
+
+        summary = str(event.get("SUMMARY", ""))
+        summary_id = summary_index.setdefault(summary, len(summary_index))
+
+        if "RECURRENCE-ID" in event:
+            moved.setdefault(str(event.get("UID")), []).append(
+                int(_to_datetime(event.get("RECURRENCE-ID").dt).timestamp())
+            )
+        elif "RRULE" in event:
+            recurring.append((event, start_time, end_time, summary_id))
+            continue
+
+        summary_ids.append(summary_id)
+        starts.append(int(start_time.timestamp()))
+        ends.append(int(end_time.timestamp()))
+
+    recurrences = []
+    for event, start_time, end_time, summary_id in recurring:
+        recurrence = Recurrence(
+            summary_id,
+            _with_named_zone(start_time),
+            int((end_time - start_time).total_seconds()),
+            event.get("RRULE").to_ical().decode(),
+            _exdates(event) + moved.get(str(event.get("UID")), []),
+        )
+        try:
+            next(recurrence.occurrences(int(start_time.timestamp()), 2**62), None)
+        except ValueError:
+            # A rule dateutil rejects (e.g. a floating UNTIL on a zoned start),
+            # keep the first occurrence only.
+            summary_ids.append(summary_id)
+            starts.append(int(start_time.timestamp()))
+            ends.append(int(end_time.timestamp()))
+        else:
+            recurrences.append(recurrence)
+
+    return EventStore.from_columns(
+        starts, ends, summary_ids, list(summary_index), recurrences=recurrences
+    )
+
+
+class ParsePool:
+    """Runs `parse_ics` off the event loop.
+
+    Bodies up to `inline_max_bytes` are parsed inline since shipping them to
+    another process costs more than parsing them. Larger ones go to a process
+    pool, or to a thread if the pool is disabled (`max_workers=0`) or broke.
+    """
+
+    def __init__(self) -> None:
+        self._executor: ProcessPoolExecutor | None = None
+        self.inline_max_bytes = DEFAULT_INLINE_MAX_BYTES
+
+    def start(
+        self, max_workers: int, inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES
+    ) -> None:
+        self.inline_max_bytes = inline_max_bytes
+        load_parser()
+        if max_workers > 0 and self._executor is None:
+            # Spawn rather than fork since the parent already runs threads
+            # (event loop executors, DB client).
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            # Starts the workers (one per submit) and loads the parser in them
+            # in the background, instead of on the first large calendars.
+            for _ in range(max_workers):
+                self._executor.submit(load_parser)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def parse(self, body: str) -> EventStore:
+        if len(body) <= self.inline_max_bytes:
+            return parse_ics(body)
+
+        if self._executor is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._executor, parse_ics, body)
+            except BrokenProcessPool:
+                _log.exception("ICS parse pool broke, falling back to threads")
+                self._executor = None
+
+        return await asyncio.to_thread(parse_ics, body)
+
+
+parse_pool = ParsePool()
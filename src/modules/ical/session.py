@@ -0,0 +1,55 @@
+import aiohttp
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+__all__ = ["open_session", "close_session", "client_session"]
+
+_session: aiohttp.ClientSession | None = None
+
+
+async def open_session(
+    limit: int = 100,
+    limit_per_host: int = 20,
+    keepalive_timeout: float = 30,
+    dns_cache_ttl: int = 300,
+) -> aiohttp.ClientSession:
+    """Opens the application-wide session used for every calendar download.
+
+    Must be called from within the running event loop (e.g. the FastAPI
+    lifespan) since aiohttp binds the connector to it.
+    """
+    global _session
+
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl,
+        use_dns_cache=True,
+    )
+    _session = aiohttp.ClientSession(connector=connector)
+
+    return _session
+
+
+async def close_session() -> None:
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+@asynccontextmanager
+async def client_session() -> AsyncIterator[aiohttp.ClientSession]:
+    """Yields the shared session, or a throwaway one when the app lifespan has
+    not opened it (e.g. when running `python -m modules.ical`)."""
+    if _session is not None and not _session.closed:
+        yield _session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
@@ -0,0 +1,471 @@
+# Parsed calendars are stored per user in the calendars collection and kept
+# fresh in the background, so requests read timetables from the DB instead of
+# downloading them from every member's timetable server.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+
+from collections import defaultdict
+from enum import StrEnum
+from typing import AsyncIterator, Sequence, TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from models.calendar_models import (
+    CalendarSnapshotDto,
+    SnapshotEventsDto,
+    SnapshotRecurrenceDto,
+)
+from modules.db import CalendarRef, CollectionRef, database
+from modules.metrics import Counter
+from .cache import calendar_cache
+from .calendar import Calendar, CalendarFetchError
+from .store import EventStore, Recurrence
+
+if TYPE_CHECKING:
+    from models.user_models import UserDto
+
+__all__ = [
+    "events_to_columns",
+    "events_from_columns",
+    "save_snapshot",
+    "load_calendars",
+    "iter_calendars",
+    "CalendarStatus",
+    "LoadedCalendar",
+    "SnapshotRefresher",
+    "snapshot_refresher",
+]
+
+_log = logging.getLogger("uvicorn")
+
+snapshot_refreshes = Counter(
+    "snapshot_refreshes_total",
+    "Background snapshot refreshes by result: refreshed, unchanged or failed.",
+    ("result",),
+)
+
+
+def events_to_columns(events: EventStore) -> SnapshotEventsDto:
+    return SnapshotEventsDto(
+        summaries=list(events.summaries),
+        summary_ids=events.summary_ids.tolist(),
+        starts=events.starts.tolist(),
+        ends=events.ends.tolist(),
+        recurrences=[
+            SnapshotRecurrenceDto(
+                summary_id=recurrence.summary_id,
+                start=recurrence.start.isoformat(),
+                tzid=recurrence.tzid,
+                duration=recurrence.duration,
+                rule=recurrence.rule,
+                exdates=sorted(recurrence.exdates),
+            )
+            for recurrence in events.recurrences
+        ],
+    )
+
+
+def events_from_columns(columns: SnapshotEventsDto) -> EventStore:
+    return EventStore.from_columns(
+        columns.starts,
+        columns.ends,
+        columns.summary_ids,
+        columns.summaries,
+        recurrences=[
+            Recurrence.from_iso(
+                recurrence.summary_id,
+                recurrence.start,
+                recurrence.tzid,
+                recurrence.duration,
+                recurrence.rule,
+                recurrence.exdates,
+            )
+            for recurrence in columns.recurrences
+        ],
+    )
+
+
+def _snapshot_of(user_id: str, calendar: Calendar) -> CalendarSnapshotDto:
+    now = time.time()
+    return CalendarSnapshotDto(
+        id=user_id,
+        calender_ics_link=calendar.url,
+        etag=calendar.etag,
+        last_modified=calendar.last_modified,
+        content_hash=calendar.content_hash,
+        fetched_at=now,
+        next_refresh_at=now + snapshot_refresher.refresh_in(),
+        events=events_to_columns(calendar.events),
+    )
+
+
+async def save_snapshot(user_id: str, calendar: Calendar) -> None:
+    calendar_collection = database.collection(CollectionRef.CALENDARS)
+    await calendar_collection.replace_one(
+        {CalendarRef.ID: user_id},
+        _snapshot_of(user_id, calendar).model_dump(),
+        upsert=True,
+    )
+
+
+def _snapshot_events(snapshot: CalendarSnapshotDto) -> EventStore:
+    """Events of a stored snapshot, reusing the cached store when this process
+    already holds the same calendar body."""
+    url = snapshot.calender_ics_link
+    cached = calendar_cache.peek(url)
+    if (
+        cached is not None
+        and snapshot.content_hash is not None
+        and cached.content_hash == snapshot.content_hash
+    ):
+        return cached.events
+
+    # Cached with its stored validators, so a later refresh can get a 304.
+    return calendar_cache.put(
+        url,
+        events_from_columns(snapshot.events),
+        etag=snapshot.etag,
+        last_modified=snapshot.last_modified,
+        content_hash=snapshot.content_hash,
+        age=max(time.time() - snapshot.fetched_at, 0),
+    ).events
+
+
+class CalendarStatus(StrEnum):
+    FRESH = "fresh"
+    # Served from a snapshot that is overdue or whose refreshes keep failing.
+    STALE = "stale"
+    # No snapshot, and the calendar could not be fetched in time.
+    MISSING = "missing"
+
+
+class LoadedCalendar:
+    __slots__ = ("events", "status")
+
+    def __init__(self, events: EventStore, status: CalendarStatus) -> None:
+        self.events = events
+        self.status = status
+
+    @classmethod
+    def missing(cls) -> "LoadedCalendar":
+        return cls(EventStore.empty(), CalendarStatus.MISSING)
+
+
+# Live fetches still running after their request moved on. They finish in
+# the background and store a snapshot for the next request.
+_late_fetches: set[asyncio.Task] = set()
+
+
+async def _fetch_live(
+    user_id: str, url: str, hedge_after: float | None = None
+) -> EventStore | None:
+    calender = Calendar(url)
+    try:
+        if not await calender.fetch_calendar(
+            timeout=snapshot_refresher.fetch_timeout, hedge_after=hedge_after
+        ):
+            return None
+    except CalendarFetchError:
+        _log.warning(f"Could not fetch calendar of user {user_id}", exc_info=True)
+        return None
+
+    try:
+        await save_snapshot(user_id, calender)
+    except Exception:
+        # Stored by the next fetch instead, the events are good either way.
+        _log.warning(f"Could not save calendar of user {user_id}", exc_info=True)
+    return calender.events
+
+
+async def iter_calendars(
+    users: Sequence[UserDto | None],
+    timeout: float | None = None,
+    hedge_after: float | None = None,
+) -> AsyncIterator[tuple[str, LoadedCalendar]]:
+    """Yields `(user_id, calendar)` for every user with a calendar as soon as
+    it is ready: stored snapshots first, then live fetches as they finish,
+    then the ones that missed the deadline. See `load_calendars`."""
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+
+    links = {
+        user.id: user.calender_ics_link
+        for user in users
+        if user is not None and user.calender_ics_link
+    }
+    if not links:
+        return
+
+    loaded = set()
+    calendar_collection = database.collection(CollectionRef.CALENDARS)
+    async for snapshot in calendar_collection.find(
+        {CalendarRef.ID: {"$in": list(links)}}
+    ):
+        snapshot = CalendarSnapshotDto.model_validate(snapshot)
+
+        # The user may have uploaded another calendar since.
+        if snapshot.calender_ics_link == links[snapshot.id]:
+            loaded.add(snapshot.id)
+            if snapshot_refresher.is_stale(snapshot):
+                status = CalendarStatus.STALE
+            else:
+                status = CalendarStatus.FRESH
+            yield snapshot.id, LoadedCalendar(_snapshot_events(snapshot), status)
+
+    fetches = {
+        asyncio.create_task(_fetch_live(user_id, url, hedge_after)): user_id
+        for user_id, url in links.items()
+        if user_id not in loaded
+    }
+    pending = set(fetches)
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                events = task.result()
+                if events is None:
+                    yield fetches[task], LoadedCalendar.missing()
+                else:
+                    yield fetches[task], LoadedCalendar(events, CalendarStatus.FRESH)
+
+        for task in pending:
+            yield fetches[task], LoadedCalendar.missing()
+    finally:
+        # Also reached when the caller stops early, e.g. a client going away.
+        for task in pending:
+            _late_fetches.add(task)
+            task.add_done_callback(_late_fetches.discard)
+
+
+async def load_calendars(
+    users: Sequence[UserDto | None],
+    timeout: float | None = None,
+    hedge_after: float | None = None,
+) -> dict[str, LoadedCalendar]:
+    """Calendar of every user with one, keyed by user id.
+
+    Reads all stored snapshots in one query. Only users without a snapshot of
+    their current calendar (e.g. saved before snapshots existed) are fetched
+    live, and stored for next time. Whatever is not fetched within `timeout`
+    seconds of the call, or cannot be fetched at all, is returned as
+    `MISSING` with no events; fetches that are merely late keep running in
+    the background. `hedge_after` is passed on to the live fetches.
+    """
+    return {
+        user_id: calendar
+        async for user_id, calendar in iter_calendars(users, timeout, hedge_after)
+    }
+
+
+class SnapshotRefresher:
+    """Background task re-fetching snapshots once they are due.
+
+    Every `poll_interval` seconds it claims up to `batch_size` snapshots whose
+    `next_refresh_at` has passed and refreshes them, at most `max_concurrency`
+    at a time and `per_host_concurrency` per timetable server. Successful
+    refreshes are due again after `refresh_interval` seconds, failed ones
+    after `backoff_base * 2 ** (failures - 1)` seconds, capped at
+    `backoff_max`. All delays are jittered by `jitter` so snapshots saved
+    together do not stay in lockstep.
+
+    Claiming moves a snapshot's `next_refresh_at` past the fetch timeout first,
+    so several processes can run a refresher without fetching the same
+    calendar twice.
+    """
+
+    def __init__(self) -> None:
+        self.refresh_interval = 21600.0
+        self.poll_interval = 60.0
+        self.batch_size = 50
+        self.max_concurrency = 8
+        self.per_host_concurrency = 2
+        self.backoff_base = 300.0
+        self.backoff_max = 86400.0
+        self.jitter = 0.1
+        self.fetch_timeout = 30.0
+        self.stale_after = 43200.0
+
+        self._task: asyncio.Task | None = None
+        self._limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host_concurrency)
+        )
+
+    def refresh_in(self) -> float:
+        """Seconds until a snapshot saved now is due for a refresh."""
+        return self._jittered(self.refresh_interval)
+
+    def is_stale(self, snapshot: CalendarSnapshotDto) -> bool:
+        """Whether the last refresh failed or none succeeded for too long."""
+        return (
+            snapshot.failures > 0
+            or time.time() - snapshot.fetched_at > self.stale_after
+        )
+
+    def backoff(self, failures: int) -> float:
+        delay = self.backoff_base * 2 ** max(failures - 1, 0)
+        return self._jittered(min(delay, self.backoff_max))
+
+    async def start(
+        self,
+        refresh_interval: float = 21600.0,
+        poll_interval: float = 60.0,
+        batch_size: int = 50,
+        max_concurrency: int = 8,
+        per_host_concurrency: int = 2,
+        backoff_base: float = 300.0,
+        backoff_max: float = 86400.0,
+        jitter: float = 0.1,
+        fetch_timeout: float = 30.0,
+        stale_after: float = 43200.0,
+    ) -> None:
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.fetch_timeout = fetch_timeout
+        self.stale_after = stale_after
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._host_limits.clear()
+
+        # Snapshots stored before refreshing existed have no due time yet.
+        calendar_collection = database.collection(CollectionRef.CALENDARS)
+        await calendar_collection.update_many(
+            {CalendarRef.NEXT_REFRESH_AT: {"$exists": False}},
+            {"$set": {CalendarRef.NEXT_REFRESH_AT: 0}},
+        )
+
+        self._task = asyncio.create_task(self._run(), name="snapshot-refresher")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def refresh_due(self) -> int:
+        """Refreshes one batch of due snapshots and returns how many it took."""
+        calendar_collection = database.collection(CollectionRef.CALENDARS)
+        now = time.time()
+
+        due = []
+        async for document in calendar_collection.find(
+            {CalendarRef.NEXT_REFRESH_AT: {"$lte": now}}, limit=self.batch_size
+        ):
+            due.append(CalendarSnapshotDto.model_validate(document))
+
+        claimed = []
+        for snapshot in due:
+            # Only succeeds if no other process claimed it in the meantime.
+            if await calendar_collection.find_one_and_update(
+                {
+                    CalendarRef.ID: snapshot.id,
+                    CalendarRef.NEXT_REFRESH_AT: snapshot.next_refresh_at,
+                },
+                {"$set": {CalendarRef.NEXT_REFRESH_AT: now + 2 * self.fetch_timeout}},
+                projection={CalendarRef.ID: True},
+            ):
+                claimed.append(snapshot)
+
+        await asyncio.gather(*(self._refresh(snapshot) for snapshot in claimed))
+        return len(due)
+
+    async def _run(self) -> None:
+        # Spread out processes that started together.
+        await asyncio.sleep(random.uniform(0, self.poll_interval))
+        while True:
+            try:
+                taken = await self.refresh_due()
+            except Exception:
+                _log.exception("Refreshing calendar snapshots failed")
+                taken = 0
+
+            # A full batch means more may be due already.
+            if taken < self.batch_size:
+                await asyncio.sleep(self._jittered(self.poll_interval))
+
+    async def _refresh(self, snapshot: CalendarSnapshotDto) -> None:
+        url = snapshot.calender_ics_link
+        # Lets the fetch send the stored validators and get a 304.
+        if calendar_cache.peek(url) is None:
+            _snapshot_events(snapshot)
+
+        calender = Calendar(url)
+        async with self._limit, self._host_limits[urlsplit(url).hostname or ""]:
+            try:
+                # Anything cached before the snapshot was taken is no newer.
+                fetched = await calender.fetch_calendar(
+                    timeout=self.fetch_timeout,
+                    max_age=time.time() - snapshot.fetched_at,
+                )
+            except CalendarFetchError:
+                _log.info(f"Could not refresh calendar {url}", exc_info=True)
+                fetched = False
+
+        calendar_collection = database.collection(CollectionRef.CALENDARS)
+        # Matching the link keeps a calendar uploaded meanwhile from being
+        # overwritten by the old one.
+        owner = {
+            CalendarRef.ID: snapshot.id,
+            CalendarRef.CALENDER_ICS_LINK: url,
+        }
+
+        if not fetched:
+            snapshot_refreshes.inc(result="failed")
+            failures = snapshot.failures + 1
+            await calendar_collection.update_one(
+                owner,
+                {
+                    "$set": {
+                        CalendarRef.FAILURES: failures,
+                        CalendarRef.NEXT_REFRESH_AT: time.time()
+                        + self.backoff(failures),
+                    }
+                },
+            )
+        elif (
+            snapshot.content_hash is not None
+            and calender.content_hash == snapshot.content_hash
+        ):
+            # Same body, only the bookkeeping changes.
+            snapshot_refreshes.inc(result="unchanged")
+            now = time.time()
+            await calendar_collection.update_one(
+                owner,
+                {
+                    "$set": {
+                        CalendarRef.ETAG: calender.etag,
+                        CalendarRef.LAST_MODIFIED: calender.last_modified,
+                        CalendarRef.FETCHED_AT: now,
+                        CalendarRef.NEXT_REFRESH_AT: now + self.refresh_in(),
+                        CalendarRef.FAILURES: 0,
+                    }
+                },
+            )
+        else:
+            snapshot_refreshes.inc(result="refreshed")
+            await calendar_collection.replace_one(
+                owner, _snapshot_of(snapshot.id, calender).model_dump()
+            )
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+snapshot_refresher = SnapshotRefresher()
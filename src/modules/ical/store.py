@@ -0,0 +1,358 @@
+import numpy as np
+
+from datetime import datetime, timedelta, timezone
+from dateutil.rrule import rrule, rrulestr
+from typing import Iterator, Sequence
+from zoneinfo import ZoneInfo
+
+__all__ = ["Event", "EventStore", "Recurrence"]
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+class Recurrence:
+    """A recurring event, kept as its rule and only expanded on demand.
+
+    `start` is the first occurrence. When it has a named time zone, rules are
+    expanded in that zone so occurrences keep their wall-clock time across
+    daylight saving changes. `exdates` are the epoch starts of occurrences
+    that were cancelled or moved.
+    """
+
+    __slots__ = ("summary_id", "start", "duration", "rule", "exdates", "_rrule")
+
+    def __init__(
+        self,
+        summary_id: int,
+        start: datetime,
+        duration: int,
+        rule: str,
+        exdates: Sequence[int] = (),
+    ) -> None:
+        self.summary_id = summary_id
+        self.start = start
+        self.duration = duration
+        self.rule = rule
+        self.exdates = frozenset(exdates)
+        self._rrule: rrule | None = None
+
+    @property
+    def tzid(self) -> str | None:
+        return getattr(self.start.tzinfo, "key", None)
+
+    def occurrences(self, start: int, end: int) -> Iterator[int]:
+        """Lazily yields the epoch starts of occurrences overlapping
+        `[start, end)`, in order."""
+        if self._rrule is None:
+            # Raises ValueError for rules dateutil cannot handle.
+            self._rrule = rrulestr(self.rule, dtstart=self.start)
+
+        # Occurrences starting up to one duration earlier still overlap.
+        after = start - self.duration
+        if after < self.start.timestamp():
+            candidates = iter(self._rrule)
+        elif self.start.tzinfo is None:
+            candidates = self._rrule.xafter(datetime.fromtimestamp(after))
+        else:
+            candidates = self._rrule.xafter(datetime.fromtimestamp(after, timezone.utc))
+
+        for occurrence in candidates:
+            occurrence_start = int(occurrence.timestamp())
+            if occurrence_start >= end:
+                return
+            if occurrence_start not in self.exdates:
+                yield occurrence_start
+
+    @classmethod
+    def from_iso(
+        cls,
+        summary_id: int,
+        start: str,
+        tzid: str | None,
+        duration: int,
+        rule: str,
+        exdates: Sequence[int] = (),
+    ) -> "Recurrence":
+        """Inverse of `start.isoformat()` and `tzid`, for stored recurrences."""
+        start = datetime.fromisoformat(start)
+        if tzid is not None:
+            start = start.replace(tzinfo=ZoneInfo(tzid))
+
+        return cls(summary_id, start, duration, rule, exdates)
+
+    # Named zones are sent by key, the parsed rule is rebuilt on demand.
+    def __getstate__(self):
+        return (
+            self.summary_id,
+            self.start.isoformat(),
+            self.tzid,
+            self.duration,
+            self.rule,
+            tuple(self.exdates),
+        )
+
+    def __setstate__(self, state) -> None:
+        other = Recurrence.from_iso(*state)
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+
+class EventStore:
+    """Immutable columnar store of a calendar's events, sorted by start.
+
+    Times are int64 epoch seconds. Summaries are interned: `summaries` holds
+    every distinct summary once and `summary_ids` indexes into it. Slices and
+    windows share the parent's arrays instead of copying them, and the arrays
+    are read-only so one store can be handed to any number of requests.
+
+    Recurring events are kept apart as `recurrences` and are not part of the
+    columns. Only `window` and `expand` turn them into concrete events, which
+    end up in the columns of the store they return.
+    """
+
+    __slots__ = (
+        "starts",
+        "ends",
+        "durations",
+        "summary_ids",
+        "summaries",
+        "recurrences",
+        "_running_end",
+    )
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        durations: np.ndarray,
+        summary_ids: np.ndarray,
+        summaries: tuple[str, ...],
+        recurrences: tuple[Recurrence, ...] = (),
+    ) -> None:
+        """Takes columns already sorted by start. Use `from_columns` otherwise."""
+        self.starts = _readonly(starts)
+        self.ends = _readonly(ends)
+        self.durations = _readonly(durations)
+        self.summary_ids = _readonly(summary_ids)
+        self.summaries = summaries
+        self.recurrences = recurrences
+        self._running_end: np.ndarray | None = None
+
+    @classmethod
+    def empty(cls) -> "EventStore":
+        empty = np.empty(0, dtype=np.int64)
+        return cls(empty, empty, empty, np.empty(0, dtype=np.int32), ())
+
+    @classmethod
+    def from_columns(
+        cls,
+        starts: Sequence[int],
+        ends: Sequence[int],
+        summary_ids: Sequence[int],
+        summaries: Sequence[str],
+        durations: Sequence[int] | None = None,
+        recurrences: Sequence[Recurrence] = (),
+    ) -> "EventStore":
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        summary_ids = np.asarray(summary_ids, dtype=np.int32)
+        if durations is None:
+            durations = ends - starts
+        else:
+            durations = np.asarray(durations, dtype=np.int64)
+
+        order = np.argsort(starts, kind="stable")
+
+        return cls(
+            starts[order],
+            ends[order],
+            durations[order],
+            summary_ids[order],
+            tuple(summaries),
+            tuple(recurrences),
+        )
+
+    def window(self, start: int, end: int) -> "EventStore":
+        """Events overlapping `[start, end)`, with recurring events expanded
+        inside the window only.
+
+        Without recurrences this is a view on this store whenever the
+        overlapping events are contiguous, which is always the case unless
+        events overlap each other.
+        """
+        singles = self._window_singles(start, end)
+        if not self.recurrences:
+            return singles
+
+        return singles._with_occurrences(
+            (recurrence, recurrence.occurrences(start, end))
+            for recurrence in self.recurrences
+        )
+
+    def expand(self, until: int) -> "EventStore":
+        """Every event, with recurring events expanded up to `until`."""
+        if not self.recurrences:
+            return self
+
+        return self[:]._with_occurrences(
+            (recurrence, recurrence.occurrences(-(2**62), until))
+            for recurrence in self.recurrences
+        )
+
+    def _with_occurrences(self, occurrences) -> "EventStore":
+        """A new store holding the (non-recurring) events of this one plus the
+        given `(recurrence, starts)` occurrences."""
+        starts = [self.starts]
+        durations = [self.durations]
+        summary_ids = [self.summary_ids]
+        for recurrence, occurrence_starts in occurrences:
+            occurrence_starts = np.fromiter(occurrence_starts, dtype=np.int64)
+            starts.append(occurrence_starts)
+            durations.append(np.full_like(occurrence_starts, recurrence.duration))
+            summary_ids.append(
+                np.full(occurrence_starts.size, recurrence.summary_id, np.int32)
+            )
+
+        starts = np.concatenate(starts)
+        durations = np.concatenate(durations)
+
+        return EventStore.from_columns(
+            starts,
+            starts + durations,
+            np.concatenate(summary_ids),
+            self.summaries,
+            durations=durations,
+        )
+
+    def _window_singles(self, start: int, end: int) -> "EventStore":
+        # Events are sorted by start, so everything from the first event whose
+        # running maximum end passes `start` up to the last one starting before
+        # `end` is a candidate.
+        if self._running_end is None:
+            self._running_end = _readonly(np.maximum.accumulate(self.ends))
+        lo = int(np.searchsorted(self._running_end, start, side="right"))
+        hi = int(np.searchsorted(self.starts, end, side="left"))
+        if hi <= lo:
+            return self[0:0]
+
+        overlapping = self.ends[lo:hi] > start
+        if overlapping.all():
+            return self[lo:hi]
+
+        return self._take(np.flatnonzero(overlapping) + lo)
+
+    def rows(self) -> Iterator[tuple[str, int, int, int]]:
+        """(summary, start, end, duration) per event, as plain Python values.
+        Much cheaper than going through `Event` views for serialization."""
+        summaries = self.summaries
+        return zip(
+            (summaries[i] for i in self.summary_ids.tolist()),
+            self.starts.tolist(),
+            self.ends.tolist(),
+            self.durations.tolist(),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.starts.nbytes
+            + self.ends.nbytes
+            + self.durations.nbytes
+            + self.summary_ids.nbytes
+        )
+
+    def _take(self, index: np.ndarray) -> "EventStore":
+        return EventStore(
+            self.starts[index],
+            self.ends[index],
+            self.durations[index],
+            self.summary_ids[index],
+            self.summaries,
+        )
+
+    def __len__(self) -> int:
+        return self.starts.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EventStore(
+                self.starts[index],
+                self.ends[index],
+                self.durations[index],
+                self.summary_ids[index],
+                self.summaries,
+            )
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+
+        return Event(self, index)
+
+    def __iter__(self) -> Iterator["Event"]:
+        for index in range(len(self)):
+            yield Event(self, index)
+
+    # Unpickled arrays come back writeable, so restore the flag on load (stores
+    # are sent back from the parse worker processes).
+    def __getstate__(self):
+        return (
+            self.starts,
+            self.ends,
+            self.durations,
+            self.summary_ids,
+            self.summaries,
+            self.recurrences,
+        )
+
+    def __setstate__(self, state) -> None:
+        starts, ends, durations, summary_ids, summaries, recurrences = state
+        self.starts = _readonly(starts)
+        self.ends = _readonly(ends)
+        self.durations = _readonly(durations)
+        self.summary_ids = _readonly(summary_ids)
+        self.summaries = summaries
+        self.recurrences = recurrences
+        self._running_end = None
+
+
+class Event:
+    """A single event of an `EventStore`, read straight from its columns."""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: EventStore, index: int) -> None:
+        self._store = store
+        self._index = index
+
+    @property
+    def summary(self) -> str:
+        return self._store.summaries[self._store.summary_ids[self._index]]
+
+    @property
+    def start_timestamp(self) -> int:
+        return int(self._store.starts[self._index])
+
+    @property
+    def end_timestamp(self) -> int:
+        return int(self._store.ends[self._index])
+
+    @property
+    def duration_seconds(self) -> int:
+        return int(self._store.durations[self._index])
+
+    @property
+    def start_time(self) -> datetime:
+        return datetime.fromtimestamp(self.start_timestamp, timezone.utc)
+
+    @property
+    def end_time(self) -> datetime:
+        return datetime.fromtimestamp(self.end_timestamp, timezone.utc)
+
+    @property
+    def duration(self) -> timedelta:
+        return timedelta(seconds=self.duration_seconds)
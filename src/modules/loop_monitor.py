@@ -0,0 +1,163 @@
+# Event loop lag monitoring and blocking call detection.
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from pathlib import Path
+
+from modules.metrics import Counter, Histogram
+
+__all__ = ["LoopMonitor", "loop_monitor"]
+
+_log = logging.getLogger("uvicorn")
+
+SRC_DIR = str(Path(__file__).resolve().parent.parent) + os.sep
+
+# Pass-through wrappers in most stacks, never blamed for a block themselves.
+WRAPPER_FILES = (
+    os.path.join("web", "metrics.py"),
+    os.path.join("modules", "db", "instrumented.py"),
+)
+
+loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran the monitor's periodic probe.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+loop_blocks = Counter(
+    "event_loop_blocks_total",
+    "Times the event loop was blocked past the threshold, by the innermost "
+    "app function running at the time (unknown if none was caught).",
+    ("location",),
+)
+
+
+def _location(stack: traceback.StackSummary) -> str:
+    """The innermost app function in `stack`, or else the innermost one."""
+    for frame in reversed(stack):
+        filename = os.path.realpath(frame.filename)
+        if filename.startswith(SRC_DIR):
+            filename = os.path.relpath(filename, SRC_DIR)
+            if filename not in WRAPPER_FILES:
+                return f"{filename}:{frame.name}"
+
+    return f"{stack[-1].filename}:{stack[-1].name}"
+
+
+class LoopMonitor:
+    """Samples event loop lag and reports what blocked it.
+
+    A probe task sleeps `interval` seconds at a time and records how late it
+    wakes up. Meanwhile a watchdog thread checks every quarter `threshold`
+    whether the probe is overdue by half the threshold; if so the loop is
+    stuck in some callback, and the watchdog captures the loop thread's
+    stack. Once the loop gets to the probe again and it was late by at least
+    `threshold`, the block is logged as one JSON line with its duration and
+    that stack, and counted by location.
+
+    Blocks shorter than `threshold` plus the time left of the probe's sleep
+    can go unnoticed, so keep `interval` well below `threshold`.
+    """
+
+    def __init__(self) -> None:
+        self.interval = 0.05
+        self.threshold = 0.1
+        self.max_frames = 20
+
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: int | None = None
+        # When the probe should wake up next, and the stack caught while it
+        # was overdue, along with the wake-up it was overdue for.
+        self._due: float | None = None
+        self._caught: tuple[float, traceback.StackSummary] | None = None
+
+    def configure(
+        self,
+        interval: float | None = None,
+        threshold: float | None = None,
+        max_frames: int | None = None,
+    ) -> None:
+        if interval is not None:
+            self.interval = interval
+        if threshold is not None:
+            self.threshold = threshold
+        if max_frames is not None:
+            self.max_frames = max_frames
+
+    async def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._probe(), name="loop-monitor")
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._stopping.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._watchdog.join(timeout=1)
+        self._watchdog = None
+        self._due = None
+
+    async def _probe(self) -> None:
+        while True:
+            due = time.monotonic() + self.interval
+            self._due = due
+            await asyncio.sleep(self.interval)
+
+            lag = max(0.0, time.monotonic() - due)
+            loop_lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                caught = self._caught
+                self._report(lag, caught[1] if caught and caught[0] == due else None)
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.threshold / 4):
+            due = self._due
+            # Caught early, so blocks barely over the threshold have a stack.
+            if due is None or time.monotonic() - due < self.threshold / 2:
+                continue
+            if self._caught is not None and self._caught[0] == due:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                # The whole stack, outermost first, to find the app's frames.
+                stack = traceback.StackSummary.extract(
+                    traceback.walk_stack(frame), lookup_lines=False
+                )
+                stack.reverse()
+                self._caught = (due, stack)
+
+    def _report(self, lag: float, stack: traceback.StackSummary | None) -> None:
+        location = _location(stack) if stack else "unknown"
+        loop_blocks.inc(location=location)
+        block = {
+            "event": "event_loop_blocked",
+            "blocked_ms": round(lag * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "location": location,
+            "at": time.time(),
+            "stack": [
+                f"{f.filename}:{f.lineno} in {f.name}"
+                for f in (stack or ())[-self.max_frames :]
+            ],
+        }
+        _log.warning(f"Event loop blocked: {json.dumps(block)}")
+
+
+loop_monitor = LoopMonitor()
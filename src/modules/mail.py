@@ -1,33 +1,359 @@
-from fastapi_mail import FastMail, ConnectionConfig, MessageSchema, MessageType
-from pathlib import Path
+from __future__ import annotations
 
+import asyncio
+import functools
+import logging
 import os
+import random
+import time
+import uuid
+import aiosmtplib
+
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from modules.db import CollectionRef, database
+from modules.metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
 
 BASE_DIR = Path(__file__).resolve().parent
 
-print(os.getenv("MAIL_USERNAME"))
-
-mail_config = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_FROM"),
-    MAIL_PORT=587,
-    MAIL_SERVER=os.getenv("MAIL_SERVER"),
-    MAIL_FROM_NAME=os.getenv("MAIL_FROM_NAME"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    # TEMPLATE_FOLDER=Path(BASE_DIR, "templates"),
+_log = logging.getLogger("uvicorn")
+
+mail_send_seconds = Histogram(
+    "mail_send_duration_seconds",
+    "Time spent sending one mail from the outbox, including connecting, by outcome.",
+    ("outcome",),
+)
+mail_outbox_abandoned = Counter(
+    "mail_outbox_abandoned_total",
+    "Mails given up on after failing `outbox_max_attempts` times.",
+)
+mail_outbox_depth = Gauge(
+    "mail_outbox_depth",
+    "Mails waiting in the outbox, including ones waiting for a retry.",
 )
 
+# fastapi_mail (and jinja2 with it) is only imported once mail is configured
+# or sent, see `get_mail_config`.
+
+
+@functools.cache
+def get_mail_config() -> ConnectionConfig:
+    """Reads the SMTP settings from the environment on first use."""
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
+        MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
+        MAIL_FROM=os.getenv("MAIL_FROM"),
+        MAIL_PORT=587,
+        MAIL_SERVER=os.getenv("MAIL_SERVER"),
+        MAIL_FROM_NAME=os.getenv("MAIL_FROM_NAME"),
+        MAIL_STARTTLS=True,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        # TEMPLATE_FOLDER=Path(BASE_DIR, "templates"),
+    )
+
+
+@functools.cache
+def get_mail() -> FastMail:
+    from fastapi_mail import FastMail
+
+    return FastMail(config=get_mail_config())
 
-mail = FastMail(config=mail_config)
 
+def create_message(recipients: list[str], subject: str, body: str) -> MessageSchema:
+    from fastapi_mail import MessageSchema, MessageType
 
-def create_message(recipients: list[str], subject: str, body: str):
     message = MessageSchema(
         recipients=recipients, subject=subject, body=body, subtype=MessageType.html
     )
 
     return message
+
+
+class OutboxItem:
+    __slots__ = ("id", "recipients", "subject", "body", "attempts")
+
+    def __init__(
+        self,
+        recipients: list[str],
+        subject: str,
+        body: str,
+        id: str | None = None,
+        attempts: int = 0,
+    ) -> None:
+        self.id = id or str(uuid.uuid4())
+        self.recipients = recipients
+        self.subject = subject
+        self.body = body
+        self.attempts = attempts
+
+    def to_document(self) -> dict:
+        return {
+            "_id": self.id,
+            "recipients": self.recipients,
+            "subject": self.subject,
+            "body": self.body,
+            "attempts": self.attempts,
+        }
+
+    @classmethod
+    def from_document(cls, document: dict) -> "OutboxItem":
+        return cls(
+            document["recipients"],
+            document["subject"],
+            document["body"],
+            id=document["_id"],
+            attempts=document.get("attempts", 0),
+        )
+
+
+class MailOutbox:
+    """Sends mail in the background so requests never wait on SMTP.
+
+    Messages go on an asyncio queue drained by `workers` tasks. Each worker
+    keeps its SMTP connection open while there is mail to send (closing it
+    after `idle_timeout` seconds without any), sends up to `batch_size`
+    queued messages per wake-up over it, and retries failures with
+    exponential backoff up to `max_attempts` times.
+
+    With `persist` on, queued messages are also stored in the mail outbox
+    collection and re-queued on the next start, so a restart loses nothing.
+    """
+
+    def __init__(self, connection_config: ConnectionConfig | None = None) -> None:
+        # Read from the environment on start when not given.
+        self._config = connection_config
+        self._queue: asyncio.Queue[OutboxItem] | None = None
+        self._workers: list[asyncio.Task] = []
+        # Mails waiting for a retry, by the handle that re-queues them.
+        self._retry_handles: dict[asyncio.TimerHandle, OutboxItem] = {}
+        # Removals from the outbox collection of mails given up on. The loop
+        # only keeps weak references to tasks.
+        self._forgetting: set[asyncio.Task] = set()
+
+        self.batch_size = 20
+        self.max_attempts = 5
+        self.retry_backoff = 2.0
+        self.idle_timeout = 30.0
+        self.persist = False
+
+    def configure(self, connection_config: ConnectionConfig) -> None:
+        """Sends through `connection_config` instead of the SMTP settings from
+        the environment. Must be called before `start`."""
+        self._config = connection_config
+
+    @property
+    def depth(self) -> int:
+        """Messages waiting to be sent, including ones waiting for a retry."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + len(self._retry_handles)
+
+    async def start(
+        self,
+        workers: int = 1,
+        batch_size: int = 20,
+        max_attempts: int = 5,
+        retry_backoff: float = 2.0,
+        idle_timeout: float = 30.0,
+        persist: bool = False,
+    ) -> None:
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.persist = persist
+        if self._config is None:
+            self._config = get_mail_config()
+        self._queue = asyncio.Queue()
+
+        if persist:
+            outbox_collection = await database.create_collection(
+                CollectionRef.MAIL_OUTBOX, check_exists=False
+            )
+            async for document in outbox_collection.find({}):
+                self._queue.put_nowait(OutboxItem.from_document(document))
+            if self._queue.qsize():
+                _log.info(f"Re-queued {self._queue.qsize()} unsent mails")
+
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"mail-outbox-{i}")
+            for i in range(workers)
+        ]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Gives the workers `timeout` seconds to drain the queue, including
+        mails waiting for a retry, which get their last chance now. Anything
+        left is lost unless the outbox is persisted."""
+        if self._queue is None:
+            return
+
+        for handle, item in self._retry_handles.items():
+            handle.cancel()
+            self._queue.put_nowait(item)
+        self._retry_handles.clear()
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            pass
+        if self.depth:
+            kept = "kept in the outbox" if self.persist else "dropped"
+            _log.warning(f"Mail outbox stopped with {self.depth} mails unsent, {kept}")
+
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def enqueue(self, recipients: list[str], subject: str, body: str) -> None:
+        if self._queue is None:
+            # Outbox not started (e.g. scripts), fall back to sending inline.
+            await get_mail().send_message(create_message(recipients, subject, body))
+            return
+
+        item = OutboxItem(recipients, subject, body)
+        if self.persist:
+            outbox_collection = database.collection(CollectionRef.MAIL_OUTBOX)
+            await outbox_collection.insert_one(item.to_document())
+
+        self._queue.put_nowait(item)
+        mail_outbox_depth.set(self.depth)
+
+    async def _worker(self) -> None:
+        smtp = None
+        try:
+            while True:
+                try:
+                    # Only time out while a connection is open, to close it.
+                    item = await asyncio.wait_for(
+                        self._queue.get(), self.idle_timeout if smtp else None
+                    )
+                except TimeoutError:
+                    smtp = await self._disconnect(smtp)
+                    continue
+
+                batch = [item]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                smtp = await self._send_batch(smtp, batch)
+        finally:
+            await self._disconnect(smtp)
+
+    async def _send_batch(
+        self, smtp: aiosmtplib.SMTP | None, batch: list[OutboxItem]
+    ) -> aiosmtplib.SMTP | None:
+        for item in batch:
+            started = time.perf_counter()
+            try:
+                if not self._config.SUPPRESS_SEND:
+                    if smtp is None or not smtp.is_connected:
+                        smtp = await self._connect()
+                    await smtp.send_message(self._build_message(item))
+            except Exception:
+                mail_send_seconds.observe(
+                    time.perf_counter() - started, outcome="error"
+                )
+                _log.exception(f"Could not send mail {item.id}")
+                # The connection may be in any state now, start over.
+                smtp = await self._disconnect(smtp)
+                self._retry(item)
+            else:
+                mail_send_seconds.observe(time.perf_counter() - started, outcome="ok")
+                if self.persist:
+                    await self._forget(item)
+            finally:
+                self._queue.task_done()
+                mail_outbox_depth.set(self.depth)
+
+        return smtp
+
+    def _retry(self, item: OutboxItem) -> None:
+        item.attempts += 1
+        if item.attempts >= self.max_attempts:
+            mail_outbox_abandoned.inc()
+            _log.error(f"Giving up on mail {item.id} after {item.attempts} attempts")
+            if self.persist:
+                task = asyncio.create_task(self._forget(item))
+                self._forgetting.add(task)
+                task.add_done_callback(self._forgetting.discard)
+            return
+
+        delay = self.retry_backoff * 2 ** (item.attempts - 1)
+        delay *= random.uniform(0.8, 1.2)
+
+        def requeue() -> None:
+            self._retry_handles.pop(handle, None)
+            if self._queue is not None:
+                self._queue.put_nowait(item)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_handles[handle] = item
+
+    def _build_message(self, item: OutboxItem) -> EmailMessage:
+        sender = self._config.MAIL_FROM
+        if self._config.MAIL_FROM_NAME is not None:
+            sender = formataddr((self._config.MAIL_FROM_NAME, self._config.MAIL_FROM))
+
+        message = EmailMessage()
+        message["Date"] = formatdate(localtime=True)
+        # The sender's domain, as looking up the host's would block the loop.
+        message["Message-ID"] = make_msgid(
+            domain=self._config.MAIL_FROM.rpartition("@")[2]
+        )
+        message["To"] = ", ".join(item.recipients)
+        message["From"] = sender
+        message["Subject"] = item.subject
+        message.set_content(item.body, subtype="html")
+
+        return message
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self._config.MAIL_SERVER,
+            port=self._config.MAIL_PORT,
+            timeout=self._config.TIMEOUT,
+            use_tls=self._config.MAIL_SSL_TLS,
+            start_tls=self._config.MAIL_STARTTLS,
+            validate_certs=self._config.VALIDATE_CERTS,
+        )
+        await smtp.connect()
+        if self._config.USE_CREDENTIALS:
+            await smtp.login(
+                self._config.MAIL_USERNAME,
+                self._config.MAIL_PASSWORD.get_secret_value(),
+            )
+
+        return smtp
+
+    async def _disconnect(self, smtp: aiosmtplib.SMTP | None) -> None:
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+    async def _forget(self, item: OutboxItem) -> None:
+        try:
+            outbox_collection = database.collection(CollectionRef.MAIL_OUTBOX)
+            await outbox_collection.delete_one({"_id": item.id})
+        except Exception:
+            # Worst case the mail is sent again after a restart.
+            _log.exception(f"Could not remove mail {item.id} from the outbox")
+
+
+mail_outbox = MailOutbox()
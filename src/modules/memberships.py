@@ -0,0 +1,117 @@
+# Room memberships, one document per user in a room, so the rooms of a user
+# are an indexed lookup instead of a scan of every room's member list. The
+# rooms collection stays the source of truth, these are kept in step with it.
+
+import asyncio
+import logging
+import time
+
+from modules.db import CollectionRef, Database, MembershipRef, RoomRef
+
+__all__ = [
+    "add_membership",
+    "remove_membership",
+    "remove_room_memberships",
+    "remove_user_memberships",
+    "find_user_memberships",
+    "backfill_memberships",
+]
+
+_log = logging.getLogger("uvicorn")
+
+
+def _membership_id(room_id: str, user_id: str) -> str:
+    # Deterministic, so adding a membership twice keeps a single document.
+    return f"{room_id}:{user_id}"
+
+
+async def add_membership(
+    db: Database, room_id: str, user_id: str, joined_at: float | None = None
+) -> None:
+    """Records that `user_id` is in `room_id`, keeping the original join time
+    if it already was."""
+    membership_collection = db.collection(CollectionRef.MEMBERSHIPS)
+    await membership_collection.update_one(
+        {MembershipRef.ID: _membership_id(room_id, user_id)},
+        {
+            "$setOnInsert": {
+                MembershipRef.ROOM_ID: room_id,
+                MembershipRef.USER_ID: user_id,
+                MembershipRef.JOINED_AT: (
+                    joined_at if joined_at is not None else time.time()
+                ),
+            }
+        },
+        upsert=True,
+    )
+
+
+async def remove_membership(db: Database, room_id: str, user_id: str) -> None:
+    membership_collection = db.collection(CollectionRef.MEMBERSHIPS)
+    await membership_collection.delete_one(
+        {MembershipRef.ID: _membership_id(room_id, user_id)}
+    )
+
+
+async def remove_room_memberships(db: Database, room_id: str) -> None:
+    membership_collection = db.collection(CollectionRef.MEMBERSHIPS)
+    await membership_collection.delete_many({MembershipRef.ROOM_ID: room_id})
+
+
+async def remove_user_memberships(db: Database, user_id: str) -> None:
+    membership_collection = db.collection(CollectionRef.MEMBERSHIPS)
+    await membership_collection.delete_many({MembershipRef.USER_ID: user_id})
+
+
+async def find_user_memberships(
+    db: Database, user_id: str, limit: int, after: float | None = None
+) -> list[dict]:
+    """Up to `limit` memberships of `user_id` in the order they joined, only
+    those joined after `after` if given."""
+    membership_collection = db.collection(CollectionRef.MEMBERSHIPS)
+
+    filter = {MembershipRef.USER_ID: user_id}
+    if after is not None:
+        filter[MembershipRef.JOINED_AT] = {"$gt": after}
+
+    return [
+        membership
+        async for membership in membership_collection.find(
+            filter,
+            projection={MembershipRef.ROOM_ID: True, MembershipRef.JOINED_AT: True},
+            sort={MembershipRef.JOINED_AT: 1},
+            limit=limit,
+        )
+    ]
+
+
+async def backfill_memberships(db: Database) -> int:
+    """Adds the memberships missing for the members of every room, e.g. rooms
+    made before memberships were recorded. Existing ones are left as is.
+
+    Rooms do not know when their members joined, so their memberships get
+    the time of the backfill, a microsecond apart to keep them ordered.
+    Returns how many memberships were checked.
+    """
+    room_collection = db.collection(CollectionRef.ROOMS)
+
+    started = time.perf_counter()
+    joined_at = time.time()
+    count = 0
+    async for room in room_collection.find({}, projection={RoomRef.USERS: True}):
+        user_ids = room.get(RoomRef.USERS) or []
+        await asyncio.gather(
+            *(
+                add_membership(
+                    db, room[RoomRef.ID], user_id, joined_at=joined_at + i * 1e-6
+                )
+                for i, user_id in enumerate(user_ids)
+            )
+        )
+        joined_at += len(user_ids) * 1e-6
+        count += len(user_ids)
+
+    _log.info(
+        f"Backfilled {count} room memberships in {time.perf_counter() - started:.2f}s"
+    )
+    return count
@@ -0,0 +1,193 @@
+# Prometheus metrics, kept in memory and rendered in the text exposition
+# format by GET /metrics. Every process (e.g. every uvicorn worker) keeps its
+# own, so each has to be scraped.
+
+import bisect
+import math
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "collect_spans",
+    "registry",
+]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Seconds spent per span during the current request, see `collect_spans`.
+_spans: ContextVar[dict[str, float] | None] = ContextVar("spans", default=None)
+
+
+def collect_spans() -> dict[str, float]:
+    """Starts adding up, for the rest of the current context (e.g. a request),
+    the seconds observed by histograms with a span. Returns the totals, which
+    fill in as the request goes. Concurrent calls are summed, so a span can
+    exceed the request's duration."""
+    spans = {}
+    _spans.set(spans)
+    return spans
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    elif float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    type: str
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Registry = registry,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative `buckets`. With a `span`, every
+    observation also adds to that span of the current request, see
+    `collect_spans`."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        *args,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        span: str | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self.span = span
+        # Per label set, the count of every bucket (not cumulative, the last
+        # one is +Inf) and the sum.
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+        if self.span is not None:
+            spans = _spans.get()
+            if spans is not None:
+                spans[self.span] = spans.get(self.span, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the seconds spent in the block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> list[str]:
+        samples = []
+        for key, counts in self._counts.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            samples.append(
+                f"{self.name}_sum{_format_labels(labels)} "
+                f"{_format_value(self._sums[key])}"
+            )
+            samples.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+
+        return samples
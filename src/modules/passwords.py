@@ -0,0 +1,74 @@
+# bcrypt is deliberately slow (~250 ms per hash at 12 rounds), so it must never
+# run on the event loop. The bcrypt C extension releases the GIL, which lets a
+# small thread pool hash in parallel.
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+__all__ = ["PasswordHasher", "PasswordHasherBusyError", "password_hasher"]
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many hashes are already waiting for a worker."""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a dedicated, bounded thread pool.
+
+    At most `max_workers` hashes run at once and at most `max_queue` more may
+    wait for a slot; anything beyond that is rejected straight away with
+    `PasswordHasherBusyError` instead of piling up behind a login burst.
+    """
+
+    def __init__(
+        self, rounds: int = 12, max_workers: int = 4, max_queue: int = 64
+    ) -> None:
+        self._executor = None
+        self.configure(rounds, max_workers, max_queue)
+
+    def configure(self, rounds: int, max_workers: int, max_queue: int) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+        self._context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._max_pending = max_workers + max_queue
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Hashes running or waiting for a worker."""
+        return self._pending
+
+    async def hash(self, password: str | bytes) -> str:
+        return await self._run(self._context.hash, password)
+
+    async def verify(
+        self, plain_password: str | bytes, hashed_password: str | bytes
+    ) -> bool:
+        return await self._run(self._context.verify, plain_password, hashed_password)
+
+    async def _run(self, func, *args):
+        if self._pending >= self._max_pending:
+            raise PasswordHasherBusyError("Too many password hashes in progress")
+
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
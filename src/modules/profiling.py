@@ -0,0 +1,216 @@
+# On-demand sampling profiles of single requests, in the collapsed stack
+# format read by flamegraph.pl, speedscope and most other flame graph tools.
+
+import asyncio
+import os
+import selectors
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from types import CodeType
+from typing import Iterator
+
+__all__ = ["RequestProfile", "RequestProfiler", "request_profiler"]
+
+# The profile of the request running in the current context. Tasks started
+# by the request copy the context, so their samples count for it too.
+_profiled: ContextVar["RequestProfile | None"] = ContextVar("profiled", default=None)
+
+# Stripped from file names in frames, longest first so site-packages wins over
+# the standard library directory it is in.
+_PATH_PREFIXES = sorted(
+    {
+        str(Path(__file__).resolve().parent.parent) + os.sep,
+        *(
+            sysconfig.get_paths()[name] + os.sep
+            for name in ("purelib", "platlib", "stdlib", "platstdlib")
+        ),
+    },
+    key=len,
+    reverse=True,
+)
+
+# Frames from here outwards are the event loop itself.
+_HANDLE_RUN = asyncio.Handle._run.__code__
+
+# Pseudo stacks of samples taken while the request was not running.
+AWAITING = "(awaiting I/O, timers or worker threads)"
+OTHER_WORK = "(event loop busy with other requests)"
+
+_frame_names: dict[CodeType, str] = {}
+
+
+def _frame_name(code: CodeType) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        filename = os.path.normpath(code.co_filename)
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix) :]
+                break
+        # Semicolons separate frames in the collapsed format.
+        name = f"{code.co_qualname} ({filename})".replace(";", ",")
+        _frame_names[code] = name
+
+    return name
+
+
+def _is_idle(frame) -> bool:
+    """Whether the loop thread is waiting in the selector for something to do."""
+    code = frame.f_code
+    return code.co_name == "select" and code.co_filename == selectors.__file__
+
+
+class RequestProfile:
+    """Samples the event loop thread's stack every `interval` seconds from a
+    separate thread while one request runs, for at most `max_duration`
+    seconds.
+
+    Samples taken while the request (or a task it started) is running keep
+    their stack. The others are counted as `AWAITING` when the loop is idle,
+    or `OTHER_WORK` when it is running something else, so the profile
+    accounts for the request's whole wall time.
+    """
+
+    def __init__(
+        self, method: str, path: str, interval: float, max_duration: float
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.max_duration = max_duration
+
+        self.status: int | None = None
+        self.started_at = time.time()
+        self.duration: float | None = None
+        self.truncated = False
+        self.samples: Counter[str] = Counter()
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._sampler: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._started = time.perf_counter()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._sampler = threading.Thread(
+            target=self._sample, name=f"profile-{self.id}", daemon=True
+        )
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._started
+
+    def collapsed(self) -> str:
+        """One `frame;frame;... count` line per stack, outermost frame first."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def summary(self) -> dict:
+        duration_ms = None
+        if self.duration is not None:
+            duration_ms = round(self.duration * 1000, 1)
+
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": duration_ms,
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": sum(self.samples.values()),
+            "truncated": self.truncated,
+        }
+
+    def _sample(self) -> None:
+        deadline = time.monotonic() + self.max_duration
+        while not self._stopping.wait(self.interval):
+            if time.monotonic() > deadline:
+                self.truncated = True
+                return
+            self.samples[self._stack()] += 1
+
+    def _stack(self) -> str:
+        task = asyncio.current_task(self._loop)
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return AWAITING
+
+        if task is None or task.get_context().get(_profiled) is not self:
+            return AWAITING if _is_idle(frame) else OTHER_WORK
+
+        names = []
+        while frame is not None and frame.f_code is not _HANDLE_RUN:
+            names.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        names.reverse()
+
+        return ";".join(names)
+
+
+class RequestProfiler:
+    """Profiles requests on demand and keeps the last `max_profiles`."""
+
+    def __init__(self) -> None:
+        self.enabled = True
+        self.interval = 0.005
+        self.max_duration = 60.0
+        self.max_profiles = 20
+        self._profiles: OrderedDict[str, RequestProfile] = OrderedDict()
+
+    def configure(
+        self,
+        enabled: bool | None = None,
+        interval: float | None = None,
+        max_duration: float | None = None,
+        max_profiles: int | None = None,
+    ) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if interval is not None:
+            self.interval = interval
+        if max_duration is not None:
+            self.max_duration = max_duration
+        if max_profiles is not None:
+            self.max_profiles = max_profiles
+
+    @contextmanager
+    def profile(self, method: str, path: str) -> Iterator[RequestProfile]:
+        """Profiles the block, which has to run on the event loop, and stores
+        the profile once it is done."""
+        profile = RequestProfile(method, path, self.interval, self.max_duration)
+        token = _profiled.set(profile)
+        profile.start()
+        try:
+            yield profile
+        finally:
+            _profiled.reset(token)
+            profile.stop()
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> RequestProfile | None:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        """Summaries of the stored profiles, newest first."""
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,228 @@
+# Activity suggestions for a group, based on the members' interests.
+
+import asyncio
+import logging
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+from modules.ical.flight import SingleFlight
+from modules.metrics import Counter, Histogram
+
+__all__ = [
+    "SuggestionBackend",
+    "SuggestionUnavailableError",
+    "GroqSuggestionBackend",
+    "StubSuggestionBackend",
+    "SuggestionService",
+    "create_backend",
+    "suggestion_service",
+]
+
+_log = logging.getLogger("uvicorn")
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+suggestions = Counter(
+    "suggestions_total",
+    "Suggestions asked for, by result: hit, miss or coalesced.",
+    ("result",),
+)
+suggestion_backend_seconds = Histogram(
+    "suggestion_backend_duration_seconds",
+    "Time spent waiting for the suggestion backend (the LLM), by outcome.",
+    ("outcome",),
+    span="llm",
+)
+
+PROMPT = (
+    "Can you give me a location and activity on the Monash Clayton Campus in "
+    "Melbourne, Victoria that can satisfy one of these activities for a group "
+    "of individuals: {interests} at the time {event_time}. Make sure that the "
+    "information you give is ONLY the location and the activity to do and not "
+    "any more details, just give the location and activity in 2-3 words do not "
+    "elaborate any further. Also make sure to put the location in quotation "
+    "marks. Also provide the general location as well that's within the "
+    "Clayton Campus like the area. Some suggestions are badminton courts, "
+    "basketball courts, gym, MEGA PC Gaming lounge (you must say its the MEGA "
+    "PC Gaming lounge) in the Campus centre basement, The Arcade which has "
+    "'billiard tables, foosball, dartboards, air hockey, video games' at the "
+    "sports facility (suggested for people with very mixed interests), and a "
+    "walk around the Campus's lake."
+)
+
+
+class SuggestionUnavailableError(Exception):
+    """Raised when the suggestion backend failed or none is configured."""
+
+
+class SuggestionBackend(ABC):
+    @abstractmethod
+    async def suggest(self, interests: list[str], event_time: str) -> str: ...
+
+
+class GroqSuggestionBackend(SuggestionBackend):
+    def __init__(self, api_key: str, model: str = DEFAULT_MODEL) -> None:
+        # Imported here so only processes using Groq pay for loading it.
+        from groq import AsyncGroq
+
+        self._client = AsyncGroq(api_key=api_key)
+        self._model = model
+
+    async def suggest(self, interests: list[str], event_time: str) -> str:
+        chat_completion = await self._client.chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": PROMPT.format(
+                        interests=", ".join(interests), event_time=event_time
+                    ),
+                }
+            ],
+            model=self._model,
+            stream=False,
+        )
+
+        return chat_completion.choices[0].message.content.strip()
+
+
+class StubSuggestionBackend(SuggestionBackend):
+    """Answers instantly without any network access. For local runs and tests."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    async def suggest(self, interests: list[str], event_time: str) -> str:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        return '"The Arcade" at the sports facility - billiards and air hockey'
+
+
+def create_backend(
+    name: str, api_key: str | None = None, model: str = DEFAULT_MODEL
+) -> SuggestionBackend | None:
+    """The backend called `name`, or None for Groq without an API key, so
+    suggestions are unavailable rather than the whole app failing to start."""
+    if name == "groq":
+        if not api_key:
+            _log.warning("GROQ_API_KEY is not set, suggestions are unavailable")
+            return None
+        return GroqSuggestionBackend(api_key, model)
+    elif name == "stub":
+        return StubSuggestionBackend()
+
+    raise ValueError(f"Unknown suggestion backend {name!r}")
+
+
+def normalize_interests(interests: list[str]) -> tuple[str, ...]:
+    """Splits every member's free-text preferences on commas and returns the
+    sorted set of lowercased interests, so the same group asks the same
+    question however its members wrote them."""
+    normalized = set()
+    for preferences in interests:
+        for interest in preferences.split(","):
+            interest = " ".join(interest.lower().split())
+            if interest:
+                normalized.add(interest)
+
+    return tuple(sorted(normalized))
+
+
+def bucket_event_time(event_time: str, bucket_minutes: int) -> str:
+    """Rounds ISO timestamps down to the bucket. Anything else is only
+    normalized, since clients may send free text."""
+    try:
+        when = datetime.fromisoformat(event_time.strip())
+    except ValueError:
+        return " ".join(event_time.lower().split())
+
+    minute_of_day = when.hour * 60 + when.minute
+    minute_of_day -= minute_of_day % bucket_minutes
+    when = when.replace(
+        hour=minute_of_day // 60, minute=minute_of_day % 60, second=0, microsecond=0
+    )
+
+    return when.isoformat()
+
+
+class SuggestionService:
+    """Caches suggestions per (interests, event time bucket) and collapses
+    concurrent identical requests into one backend call."""
+
+    def __init__(
+        self,
+        backend: SuggestionBackend | None = None,
+        ttl: float = 3600,
+        max_entries: int = 1024,
+        bucket_minutes: int = 60,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket_minutes = bucket_minutes
+
+        self._cache: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+        self._flight = SingleFlight()
+
+    def configure(
+        self,
+        backend: SuggestionBackend | None = None,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        bucket_minutes: int | None = None,
+    ) -> None:
+        if backend is not None:
+            self.backend = backend
+            self._cache.clear()
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if bucket_minutes is not None:
+            self.bucket_minutes = bucket_minutes
+
+    async def suggest(self, interests: list[str], event_time: str) -> str:
+        if self.backend is None:
+            raise SuggestionUnavailableError("No suggestion backend configured")
+
+        interests = normalize_interests(interests)
+        event_time = bucket_event_time(event_time, self.bucket_minutes)
+        key = (interests, event_time)
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            suggestions.inc(result="hit")
+            return cached[1]
+
+        suggestions.inc(result="coalesced" if key in self._flight else "miss")
+        return await self._flight.do(key, lambda: self._fetch(key))
+
+    async def _fetch(self, key: tuple) -> str:
+        interests, event_time = key
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            suggestion = await self.backend.suggest(list(interests), event_time)
+            outcome = "ok"
+        except Exception as e:
+            raise SuggestionUnavailableError(f"Suggestion backend failed, {e!r}") from e
+        finally:
+            suggestion_backend_seconds.observe(
+                time.perf_counter() - started, outcome=outcome
+            )
+
+        self._cache[key] = (time.monotonic() + self.ttl, suggestion)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+        return suggestion
+
+
+suggestion_service = SuggestionService()
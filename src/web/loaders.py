@@ -0,0 +1,79 @@
+# Request-scoped batch loaders (DataLoader pattern). Loads requested within the
+# same event loop iteration are collected and resolved with a single query.
+
+import asyncio
+import logging
+
+from models.user_models import UserDto
+from modules.db import CollectionRef, UserRef, database
+
+_log = logging.getLogger("uvicorn")
+
+# The Data API caps the number of values in an $in filter.
+MAX_IN_VALUES = 100
+
+# Batches being loaded. The loop only keeps weak references to tasks, and
+# nothing else holds these until they resolve the futures waiting on them.
+_batches: set[asyncio.Task] = set()
+
+
+class UserLoader:
+    """Batches and dedupes user lookups by ID.
+
+    Every `load` made before the loader gets to run is resolved by one
+    `find({"_id": {"$in": [...]}})`. Results are memoised for the lifetime of
+    the loader, so create one per request (see `get_user_loader`).
+    """
+
+    def __init__(self) -> None:
+        self._futures: dict[str, asyncio.Future[UserDto | None]] = {}
+        self._queue: list[str] = []
+
+    def load(self, user_id: str) -> asyncio.Future[UserDto | None]:
+        future = self._futures.get(user_id)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[user_id] = future
+
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue.append(user_id)
+
+        return future
+
+    async def load_many(self, user_ids: list[str]) -> list[UserDto | None]:
+        return list(await asyncio.gather(*(self.load(user_id) for user_id in user_ids)))
+
+    def _dispatch(self) -> None:
+        user_ids, self._queue = self._queue, []
+        for i in range(0, len(user_ids), MAX_IN_VALUES):
+            task = asyncio.create_task(
+                self._load_batch(user_ids[i : i + MAX_IN_VALUES])
+            )
+            _batches.add(task)
+            task.add_done_callback(_batches.discard)
+
+    async def _load_batch(self, user_ids: list[str]) -> None:
+        try:
+            user_collection = database.collection(CollectionRef.USERS)
+
+            users = {}
+            async for user in user_collection.find({UserRef.ID: {"$in": user_ids}}):
+                user = UserDto.model_validate(user)
+                users[user.id] = user
+        except Exception as e:
+            _log.exception(f"Could not load users {user_ids}")
+            for user_id in user_ids:
+                self._futures[user_id].set_exception(e)
+            return
+
+        for user_id in user_ids:
+            self._futures[user_id].set_result(users.get(user_id))
+
+
+def get_user_loader() -> UserLoader:
+    """FastAPI dependency giving each request its own loader."""
+    return UserLoader()
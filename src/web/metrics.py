@@ -0,0 +1,93 @@
+# Per-route request metrics, and a Server-Timing header breaking every
+# response's time down into database, timetable download, parse and LLM time.
+
+import time
+
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from modules.metrics import Counter, Gauge, Histogram, collect_spans
+
+http_requests = Counter(
+    "http_requests_total",
+    "Requests by method, route and status code.",
+    ("method", "route", "status"),
+)
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response is fully sent, by "
+    "method and route.",
+    ("method", "route"),
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled, by method and route.",
+    ("method", "route"),
+)
+
+# Requests that matched no route share one label, so unknown paths cannot
+# create new series.
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """Records every HTTP request by its route template (e.g.
+    `/rooms/{room_id}/calenders`), not its path.
+
+    A plain ASGI middleware rather than `BaseHTTPMiddleware`, so streamed
+    responses are timed until their last chunk and nothing is buffered.
+    `routes` is the app's route list, routes included later are seen too.
+    """
+
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]) -> None:
+        self.app = app
+        self.routes = routes
+
+    def _route(self, scope: Scope) -> str:
+        # Matched ahead of the router, which only does so after middleware.
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        method = scope["method"]
+        route = self._route(scope)
+        spans = collect_spans()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timings = [
+                    f"{span};dur={seconds * 1000:.1f}"
+                    for span, seconds in spans.items()
+                ]
+                timings.append(
+                    f"total;dur={(time.perf_counter() - started) * 1000:.1f}"
+                )
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", ()),
+                        (b"server-timing", ", ".join(timings).encode()),
+                    ],
+                }
+            await send(message)
+
+        http_requests_in_flight.inc(method=method, route=route)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            http_requests_in_flight.dec(method=method, route=route)
+            http_request_seconds.observe(
+                time.perf_counter() - started, method=method, route=route
+            )
+            http_requests.inc(method=method, route=route, status=status)
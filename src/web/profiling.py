@@ -0,0 +1,61 @@
+# Opt-in profiling of single requests, see modules.profiling.
+
+import hmac
+import logging
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+from modules.profiling import request_profiler
+
+_log = logging.getLogger("uvicorn")
+
+# Requests carrying the API key in this header are profiled. The response then
+# has the profile's ID in PROFILE_ID_HEADER, see GET /profiles/{profile_id}.
+PROFILE_KEY_HEADER = b"x-profile-key"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it with the API key. Everything else
+    passes straight through after a look at the headers."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not request_profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        key = next(
+            (value for name, value in scope["headers"] if name == PROFILE_KEY_HEADER),
+            None,
+        )
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        elif not config.INTERFACE_API_KEY or not hmac.compare_digest(
+            key, config.INTERFACE_API_KEY.encode()
+        ):
+            _log.warning(f"Not profiling {scope['path']}, invalid profile key")
+            await self.app(scope, receive, send)
+            return
+
+        with request_profiler.profile(scope["method"], scope["path"]) as profile:
+
+            async def send_with_profile_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    profile.status = message["status"]
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", ()),
+                            (PROFILE_ID_HEADER, profile.id.encode()),
+                        ],
+                    }
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile_id)
+
+        _log.info(f"Profiled {scope['method']} {scope['path']} as {profile.id}")
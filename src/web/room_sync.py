@@ -0,0 +1,81 @@
+# Builds the room sync payloads straight from the event columns. Everything is
+# made of plain ints, strings, lists and dicts, so it can go to orjson as is
+# instead of through FastAPI's generic encoder. Members are sent once under
+# `members` and referenced by ID everywhere else.
+
+import orjson
+
+from typing import Iterable, Mapping
+
+from models.room_models import RoomDto
+from models.user_models import UserDto
+from modules.availability import find_free_times
+from modules.ical import EventStore
+from modules.ical.snapshots import CalendarStatus, LoadedCalendar
+from web.windows import EventWindow
+
+
+def member_record(user: UserDto) -> dict:
+    """What room members get to see of each other."""
+    return user.model_dump(exclude=["hashed_password"])
+
+
+def schedule_record(events: EventStore) -> dict:
+    return {
+        "calender_events": [
+            {
+                "summary": summary,
+                "start_time_iso": start,
+                "end_time_iso": end,
+                "duration_seconds": duration,
+            }
+            for summary, start, end, duration in events.rows()
+        ]
+    }
+
+
+def build_room_sync(
+    room: RoomDto,
+    members: Iterable[UserDto],
+    calendars: Mapping[str, LoadedCalendar],
+    window: EventWindow,
+    required_member: str,
+) -> dict:
+    member_records = {}
+    schedules = {}
+    member_intervals = {}
+    calendar_status = {}
+
+    for user in members:
+        member_records[user.id] = member_record(user)
+        calendar = calendars.get(user.id)
+        if calendar is None:
+            continue
+
+        calendar_status[user.id] = calendar.status
+        if calendar.status == CalendarStatus.MISSING:
+            continue
+
+        events = window.select(calendar.events)
+        schedules[user.id] = schedule_record(events)
+        member_intervals[user.id] = (events.starts, events.ends)
+
+    return {
+        "message": "Schedules synced",
+        "room": room.model_dump(),
+        "members": member_records,
+        "schedules": schedules,
+        "free_times": find_free_times(
+            member_intervals, required_member, window=window.bounds
+        ),
+        # Members with a calendar that is "fresh", "stale" or "missing".
+        "calendar_status": calendar_status,
+    }
+
+
+def encode_frame(kind: str, payload: dict, stream_format: str) -> bytes:
+    """One frame of the streamed room sync, as an NDJSON line or an SSE event."""
+    data = orjson.dumps({"type": kind, **payload})
+    if stream_format == "sse":
+        return b"event: " + kind.encode() + b"\ndata: " + data + b"\n\n"
+    return data + b"\n"
@@ -8,10 +8,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Annotated
 
-import config
 from models.auth_models import TokenDto
 from models.user_models import UserDto
-from modules.db import CollectionRef, UserRef
+from modules.db import CalendarRef, CollectionRef, Database, UserRef, get_database
+from modules.memberships import remove_user_memberships
 from web.auth import require_api_key
 from web.user_auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
@@ -20,6 +20,7 @@ from web.user_auth import (
     get_current_active_user,
     get_password_hash,
     get_user,
+    invalidate_user,
 )
 
 _log = logging.getLogger("uvicorn")
@@ -40,8 +41,9 @@ async def read_users_me(
 async def reset_password(
     is_authorised: Annotated[OAuth2PasswordRequestForm, Depends(require_api_key)],
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+    user_collection = db.collection(CollectionRef.USERS)
     user = await get_user(form_data.username)
 
     if user is None:
@@ -50,11 +52,12 @@ async def reset_password(
             detail="User not found",
         )
 
-    hashed_password = get_password_hash(form_data.password)
+    hashed_password = await get_password_hash(form_data.password)
     await user_collection.update_one(
         {UserRef.ID: user.id},
         {"$set": {UserRef.HASHED_PASSWORD: hashed_password}},
     )
+    invalidate_user(user.id)
 
     return {"message": "Password reset"}
 
@@ -80,8 +83,9 @@ async def login_for_access_token(
 @router.delete("/")
 async def delete_user(
     user: Annotated[UserDto, Depends(get_current_active_user)],
+    db: Annotated[Database, Depends(get_database)],
 ):
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+    user_collection = db.collection(CollectionRef.USERS)
     deleted = None
     if user.id:
         deleted = await user_collection.delete_one({UserRef.ID: user.id})
@@ -93,6 +97,12 @@ async def delete_user(
             detail="User ID or Email was not specified",
         )
 
+    invalidate_user(user.id)
+
+    calendar_collection = db.collection(CollectionRef.CALENDARS)
+    await calendar_collection.delete_one({CalendarRef.ID: user.id})
+    await remove_user_memberships(db, user.id)
+
     if deleted.deleted_count > 0:
         _log.info(f"Deleted user {user.id}")
         return {"message": f"Deleted user {user.id}"}
@@ -4,13 +4,14 @@ import logging
 from typing import Annotated
 
 from fastapi import APIRouter, Depends
-import requests
 import config
-from modules.ical import Calendar
-from modules.db import CollectionRef, UserRef
+from modules.ical import Calendar, CalendarFetchError
+from modules.ical.snapshots import load_calendars, save_snapshot
+from modules.db import CollectionRef, Database, UserRef, get_database
 from models.user_models import UserDto
 from fastapi import HTTPException, status
-from web.user_auth import get_current_active_user, get_user
+from web.user_auth import get_current_active_user, invalidate_user
+from web.windows import EventWindow, get_event_window
 
 _log = logging.getLogger("uvicorn")
 router = APIRouter(
@@ -23,16 +24,34 @@ router = APIRouter(
 async def save_calender(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
     calender_ics_link: str,
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    
-    cal_resp = requests.get(calender_ics_link)
-    if cal_resp.ok and len(cal_resp.text) > 10:
-        user_collection = await config.db.get_collection(CollectionRef.USERS)
+    calender = Calendar(calender_ics_link)
+    try:
+        is_valid = await calender.fetch_calendar(
+            timeout=config.app_config.calendar.validation_timeout_seconds
+        )
+    except CalendarFetchError:
+        _log.info(f"Rejected calendar {calender_ics_link}", exc_info=True)
+        is_valid = False
+
+    if is_valid:
+        user_collection = db.collection(CollectionRef.USERS)
 
-        current_user.calender_ics_link = calender_ics_link
         await user_collection.update_one(
-            {UserRef.ID: current_user.id}, {"$set": current_user.model_dump_safe()}
+            {UserRef.ID: current_user.id},
+            {"$set": {UserRef.CALENDER_ICS_LINK: calender_ics_link}},
         )
+        invalidate_user(current_user.id)
+
+        # Lets room syncs in other processes start without fetching it again.
+        try:
+            await save_snapshot(current_user.id, calender)
+        except Exception:
+            # The link is saved, the next room sync fetches the calendar instead.
+            _log.warning(
+                f"Could not save calendar of user {current_user.id}", exc_info=True
+            )
 
         return {"message": "Calender saved"}
     else:
@@ -41,34 +60,39 @@ async def save_calender(
             detail="Calendar URL was not valid!",
         )
 
+
 @router.get("/")
 async def get_calender(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
+    window: Annotated[EventWindow, Depends(get_event_window)],
 ) -> dict:
-    user = await get_user(current_user.id)
-
-    if not user or not user.calender_ics_link:
+    if not current_user.calender_ics_link:
         return {"events": []}
 
-    calender = Calendar(user.calender_ics_link)
-    await calender.fetch_calendar()
-
-    user_calendars = {
-        "events": [
-            {
-                "summary": event.summary,
-                "start_time_iso": event.start_time.timestamp(),
-                "end_time_iso": event.end_time.timestamp(),
-                "duration_seconds": event.duration.seconds,
-            }
-            for event in calender.events
-        ],
-    }
+    calendar_config = config.app_config.calendar
+    calendar = (
+        await load_calendars(
+            [current_user],
+            timeout=calendar_config.sync_deadline_seconds,
+            hedge_after=calendar_config.hedge_after_seconds,
+        )
+    )[current_user.id]
 
-    if not user_calendars["events"]:
+    if not len(calendar.events) and not calendar.events.recurrences:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Calendar not found",
         )
 
-    return user_calendars
\ No newline at end of file
+    return {
+        "events": [
+            {
+                "summary": summary,
+                "start_time_iso": start,
+                "end_time_iso": end,
+                "duration_seconds": duration,
+            }
+            for summary, start, end, duration in window.select(calendar.events).rows()
+        ],
+        "status": calendar.status,
+    }
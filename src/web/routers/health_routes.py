@@ -0,0 +1,30 @@
+# Liveness and dependency health, for load balancers and uptime checks.
+
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+
+import config
+from modules.db import Database, get_database
+
+_log = logging.getLogger("uvicorn")
+router = APIRouter(
+    tags=["health"],
+)
+
+
+@router.get("/health")
+async def get_health(db: Annotated[Database, Depends(get_database)]) -> JSONResponse:
+    database_health = await db.health(
+        timeout=config.app_config.database.health_timeout_seconds
+    )
+    if database_health["status"] != "ok":
+        _log.warning(f"Database health check failed: {database_health['error']}")
+        return JSONResponse(
+            {"status": "down", "database": database_health},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    return JSONResponse({"status": "ok", "database": database_health})
@@ -3,15 +3,11 @@
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, File, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 
-from models.user_models import UserDto
-from web.user_auth import get_current_active_user
+from modules.db import CollectionRef, Database, UserRef, get_database
 
-import config
-from modules.db import CollectionRef, UserRef
-
-from modules.mail import mail, create_message
+from modules.mail import mail_outbox
 
 _log = logging.getLogger("uvicorn")
 router = APIRouter(
@@ -21,8 +17,8 @@ router = APIRouter(
 
 
 @router.post("/mail/send")
-async def send_mail(user_id: str):
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+async def send_mail(user_id: str, db: Annotated[Database, Depends(get_database)]):
+    user_collection = db.collection(CollectionRef.USERS)
     user = await user_collection.find_one({UserRef.ID: user_id})
     if user is None:
         raise HTTPException(
@@ -31,11 +27,9 @@ async def send_mail(user_id: str):
         )
     else:
         # valid user can send email
-        await mail.send_message(
-            create_message(
-                recipients=[user["email"]],
-                subject="Test",
-                body="Test",
-            )
+        await mail_outbox.enqueue(
+            recipients=[user["email"]],
+            subject="Test",
+            body="Test",
         )
-        return {"message:": "Email sent"}
+        return {"message:": "Email queued"}
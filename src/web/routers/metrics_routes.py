@@ -0,0 +1,19 @@
+# Prometheus scrape endpoint, see modules.metrics.
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from modules.metrics import registry
+from web.auth import require_api_key
+
+router = APIRouter(
+    tags=["metrics"],
+    dependencies=[Depends(require_api_key)],
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -5,10 +5,9 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends
 
-import config
-from modules.db import CollectionRef, UserRef
+from modules.db import CollectionRef, Database, UserRef, get_database
 from models.user_models import UserDto
-from web.user_auth import get_current_active_user
+from web.user_auth import get_current_active_user, invalidate_user
 
 _log = logging.getLogger("uvicorn")
 router = APIRouter(
@@ -21,12 +20,13 @@ router = APIRouter(
 async def save_preferences(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
     preferences: str,
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+    user_collection = db.collection(CollectionRef.USERS)
 
-    current_user.preferences = preferences
     await user_collection.update_one(
-        {UserRef.ID: current_user.id}, {"$set": current_user.model_dump_safe()}
+        {UserRef.ID: current_user.id}, {"$set": {UserRef.PREFERENCES: preferences}}
     )
+    invalidate_user(current_user.id)
 
     return {"message": "Preferences saved"}
@@ -0,0 +1,37 @@
+# Request profiles taken on demand, see web.profiling.
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from modules.profiling import request_profiler
+from web.auth import require_api_key
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"],
+    dependencies=[Depends(require_api_key)],
+)
+
+
+@router.get("/")
+async def get_profiles() -> dict:
+    return {"message": "Profiles fetched", "profiles": request_profiler.list()}
+
+
+@router.get("/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str) -> PlainTextResponse:
+    """The profile as collapsed stacks, e.g. for flamegraph.pl or
+    speedscope."""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found",
+        )
+
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile_id}.txt"'
+        },
+    )
@@ -1,22 +1,37 @@
 # Handle creating rooms, getting room info, getting room code, getting users to
 # join groups by code, etc.
 import asyncio
-from datetime import datetime
 import logging
 import random
 import string
 import uuid
-from typing import Annotated
-from groq import Groq
+from typing import Annotated, Literal
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 import config
-from models.room_models import RoomDto
+from models.room_models import RoomDto, RoomSummaryDto
 from models.user_models import UserDto
-from modules.db import CollectionRef, RoomRef
-from modules.ical import Calendar
-from web.user_auth import get_current_active_user, get_user
+from modules.availability import find_free_times
+from modules.db import CollectionRef, Database, MembershipRef, RoomRef, get_database
+from modules.ical.snapshots import CalendarStatus, iter_calendars, load_calendars
+from modules.memberships import (
+    add_membership,
+    find_user_memberships,
+    remove_membership,
+    remove_room_memberships,
+)
+from modules.suggestions import SuggestionUnavailableError, suggestion_service
+from web.loaders import UserLoader, get_user_loader
+from web.room_sync import (
+    build_room_sync,
+    encode_frame,
+    member_record,
+    schedule_record,
+)
+from web.windows import EventWindow, get_event_window
+from web.user_auth import get_current_active_user
 
 _log = logging.getLogger("uvicorn")
 router = APIRouter(
@@ -26,10 +41,17 @@ router = APIRouter(
 
 MAX_USERS_PER_ROOM = 10
 
+# Rooms per page of /my-rooms. The Data API caps the values in an $in filter
+# at 100, which bounds the page size.
+DEFAULT_ROOMS_PER_PAGE = 20
+MAX_ROOMS_PER_PAGE = 100
+
 
 @router.get("/{room_id}/get")
-async def get_room(room_id: str) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
+async def get_room(
+    room_id: str, db: Annotated[Database, Depends(get_database)]
+) -> dict:
+    room_collection = db.collection(CollectionRef.ROOMS)
 
     room = RoomDto.model_validate(await room_collection.find_one({RoomRef.ID: room_id}))
     if room is None:
@@ -43,15 +65,18 @@ async def get_room(room_id: str) -> dict:
 
 @router.post("/")
 async def create_room(
-    current_user: Annotated[UserDto, Depends(get_current_active_user)], room: RoomDto
+    current_user: Annotated[UserDto, Depends(get_current_active_user)],
+    room: RoomDto,
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
+    room_collection = db.collection(CollectionRef.ROOMS)
 
     room.id = str(uuid.uuid4())
     room.users = [current_user.id]
     room.owner_id = current_user.id
     room.room_code = "".join(random.choices(string.digits, k=6))
     await room_collection.insert_one(room.model_dump())
+    await add_membership(db, room.id, current_user.id)
     _log.info(f"Room {room.id} created")
 
     return {"message": "Room created", "room": room.model_dump()}
@@ -61,8 +86,9 @@ async def create_room(
 async def join_room(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
     room_code: str,
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
+    room_collection = db.collection(CollectionRef.ROOMS)
     room = RoomDto.model_validate(await room_collection.find_one({RoomRef.ROOM_CODE: room_code}))
     if room is None:
         raise HTTPException(
@@ -84,6 +110,7 @@ async def join_room(
     await room_collection.update_one(
         {RoomRef.ID: room.id}, {"$push": {"users": current_user.id}}
     )
+    await add_membership(db, room.id, current_user.id)
 
     return {"message": "User added to room", "room": room.model_dump()}
 
@@ -92,8 +119,9 @@ async def join_room(
 async def leave_room(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
     room_id: str,
+    db: Annotated[Database, Depends(get_database)],
 ) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
+    room_collection = db.collection(CollectionRef.ROOMS)
 
     room = RoomDto.model_validate(await room_collection.find_one({RoomRef.ID: room_id}))
     if room is None:
@@ -114,162 +142,199 @@ async def leave_room(
         else:
             # Delete this room
             await room_collection.delete_one({RoomRef.ID: room_id})
+            await remove_room_memberships(db, room_id)
 
             return {"message": "User left room & room deleted"}
 
     await room_collection.update_one(
         {RoomRef.ID: room_id}, {"$set": room.model_dump_safe()}
     )
+    await remove_membership(db, room_id, current_user.id)
 
     return {"message": "User removed from room", "room": room.model_dump()}
 
 
-@router.get("/{room_id}/calenders")
-async def get_room_calenders(
-    current_user: Annotated[UserDto, Depends(get_current_active_user)], room_id: str
-) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
-    room = RoomDto.model_validate(await room_collection.find_one({RoomRef.ID: room_id}))
+async def _get_member_room(db: Database, room_id: str, user: UserDto) -> RoomDto:
+    room_collection = db.collection(CollectionRef.ROOMS)
+    room = await room_collection.find_one({RoomRef.ID: room_id})
     if room is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found",
         )
-    elif current_user.id not in room.users:
+
+    room = RoomDto.model_validate(room)
+    if user.id not in room.users:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User is not in the requested room",
         )
 
-    user_calendars = {}
-    users = {}
+    return room
 
-    async def fetch_user_calender(user_id: str) -> None:
-        user = await get_user(user_id)
-        users[user.id] = user
 
-        if not user:
-            return
-        elif not user.calender_ics_link:
-            return
+@router.get("/{room_id}/calenders", response_class=ORJSONResponse)
+async def get_room_calenders(
+    current_user: Annotated[UserDto, Depends(get_current_active_user)],
+    user_loader: Annotated[UserLoader, Depends(get_user_loader)],
+    room_id: str,
+    window: Annotated[EventWindow, Depends(get_event_window)],
+    db: Annotated[Database, Depends(get_database)],
+) -> ORJSONResponse:
+    room = await _get_member_room(db, room_id, current_user)
+
+    calendar_config = config.app_config.calendar
+    members = [user for user in await user_loader.load_many(room.users) if user]
+    calendars = await load_calendars(
+        members,
+        timeout=calendar_config.sync_deadline_seconds,
+        hedge_after=calendar_config.hedge_after_seconds,
+    )
 
-        calender = Calendar(user.calender_ics_link)
-        if not await calender.fetch_calendar():
-            return
+    # Returned as a response so FastAPI does not walk it with its own encoder.
+    return ORJSONResponse(
+        build_room_sync(room, members, calendars, window, current_user.id)
+    )
 
-        user_calendars[user.id] = {
-            "user": user.model_dump(),
-            "calender_events": [
-                {
-                    "summary": event.summary,
-                    "start_time_iso": event.start_time.timestamp(),
-                    "end_time_iso": event.end_time.timestamp(),
-                    "duration_seconds": event.duration.seconds,
-                }
-                for event in calender.events
-            ],
-        }
-
-    fetch_tasks = []
-    for user_id in room.users:
-        fetch_tasks.append(fetch_user_calender(user_id))
 
-    await asyncio.gather(*fetch_tasks)
+@router.get("/{room_id}/calenders/stream")
+async def stream_room_calenders(
+    current_user: Annotated[UserDto, Depends(get_current_active_user)],
+    user_loader: Annotated[UserLoader, Depends(get_user_loader)],
+    room_id: str,
+    window: Annotated[EventWindow, Depends(get_event_window)],
+    db: Annotated[Database, Depends(get_database)],
+    stream_format: Annotated[
+        Literal["ndjson", "sse"], Query(alias="format")
+    ] = "ndjson",
+) -> StreamingResponse:
+    """Same data as `get_room_calenders`, streamed as one frame per message:
+    a `room` frame with the room and its members, a `schedule` frame per
+    member with a calendar as soon as it is loaded (status "missing" without
+    events if it could not be), and a final `free_times` frame. Frames are
+    NDJSON lines, or server-sent events named after the frame type with
+    `format=sse`."""
+    room = await _get_member_room(db, room_id, current_user)
+    members = [user for user in await user_loader.load_many(room.users) if user]
+
+    async def frames():
+        member_intervals = {}
+        calendar_status = {}
+
+        yield encode_frame(
+            "room",
+            {
+                "room": room.model_dump(),
+                "members": {user.id: member_record(user) for user in members},
+            },
+            stream_format,
+        )
 
-    start_end_times = []
-    for user_id, calender in user_calendars.items():
-        for event in calender["calender_events"]:
-            start_end_times.append(
-                {
-                    "user_id": user_id,
-                    "type": "start",
-                    "time": datetime.fromtimestamp(event["start_time_iso"]),
-                }
-            )
-            start_end_times.append(
-                {
-                    "user_id": user_id,
-                    "type": "end",
-                    "time": datetime.fromtimestamp(event["end_time_iso"]),
-                }
-            )
+        calendar_config = config.app_config.calendar
+        async for user_id, calendar in iter_calendars(
+            members,
+            timeout=calendar_config.sync_deadline_seconds,
+            hedge_after=calendar_config.hedge_after_seconds,
+        ):
+            calendar_status[user_id] = calendar.status
+            frame = {"user_id": user_id, "status": calendar.status}
+            if calendar.status != CalendarStatus.MISSING:
+                events = window.select(calendar.events)
+                frame.update(schedule_record(events))
+                member_intervals[user_id] = (events.starts, events.ends)
+
+            yield encode_frame("schedule", frame, stream_format)
+
+        free_times = find_free_times(
+            member_intervals, current_user.id, window=window.bounds
+        )
+        yield encode_frame(
+            "free_times",
+            {"free_times": free_times, "calendar_status": calendar_status},
+            stream_format,
+        )
 
-    start_end_times.sort(key=lambda x: (x["time"], 1 if x["type"] == "start" else 0))
-
-    free_times_by_time = {}
-    current_free_users = []
-    for start_end in start_end_times:
-        if start_end["type"] == "end":
-            # User has no class, is free.
-            if start_end["user_id"] not in current_free_users:
-                current_free_users.append(start_end["user_id"])
-        elif start_end["type"] == "start":
-            # User has class, no longer free.
-            if start_end["user_id"] in current_free_users:
-                i = current_free_users.index(start_end["user_id"])
-                current_free_users.pop(i)
-
-        free_times_by_time[start_end["time"].timestamp()] = current_free_users.copy()
-
-    free_times_order = sorted(free_times_by_time.keys())
-
-    free_times = []  # Same format as calender_events
-    for i, time_ in enumerate(free_times_order[:-1]):
-        free_users = free_times_by_time[time_]
-        if len(free_users) < 2:
-            continue
-
-        start_time = datetime.fromtimestamp(time_)
-        end_time = datetime.fromtimestamp(free_times_order[i + 1])
-        
-        if current_user.id not in free_users:
-            continue
-
-        if start_time.day != end_time.day:
-            continue
-
-        free_times.append(
-            {
-                "summary": "Free time",
-                "start_time_iso": start_time,
-                "end_time_iso": end_time,
-                "duration_seconds": (start_time - end_time).seconds,
-                "free_users": {
-                    user_id: users[user_id]
-                    for user_id in free_users
-                },
-            }
+    if stream_format == "sse":
+        return StreamingResponse(
+            frames(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
 
-    return {
-        "message": "Schedules synced",
-        "room": room.model_dump(),
-        "schedules": user_calendars,
-        "free_times": free_times,
-    }
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
 
 
 @router.get("/my-rooms")
 async def get_user_rooms(
     current_user: Annotated[UserDto, Depends(get_current_active_user)],
+    db: Annotated[Database, Depends(get_database)],
+    limit: Annotated[int, Query(ge=1, le=MAX_ROOMS_PER_PAGE)] = DEFAULT_ROOMS_PER_PAGE,
+    cursor: str | None = None,
 ) -> dict:
-    room_collection = await config.db.get_collection(CollectionRef.ROOMS)
-    rooms = []
-    async for room in room_collection.find({"users": current_user.id}):
-        rooms.append(room)
-    return {"message": "User rooms fetched", "rooms": rooms}
+    """A page of summaries of the user's rooms, in the order they joined
+    them. Pass `next_cursor` back as `cursor` for the next page, it is None
+    on the last one."""
+    after = None
+    if cursor is not None:
+        try:
+            after = float(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            )
+
+    # One more than asked for, to know whether there is a next page.
+    memberships = await find_user_memberships(
+        db, current_user.id, limit + 1, after=after
+    )
+    next_cursor = None
+    if len(memberships) > limit:
+        memberships = memberships[:limit]
+        next_cursor = repr(memberships[-1][MembershipRef.JOINED_AT])
+
+    room_collection = db.collection(CollectionRef.ROOMS)
+    room_ids = [membership[MembershipRef.ROOM_ID] for membership in memberships]
+    rooms = {}
+    if room_ids:
+        async for room in room_collection.find(
+            {RoomRef.ID: {"$in": room_ids}},
+            projection={
+                RoomRef.NAME: True,
+                RoomRef.ROOM_CODE: True,
+                RoomRef.OWNER_ID: True,
+                RoomRef.USERS: True,
+            },
+        ):
+            rooms[room[RoomRef.ID]] = RoomSummaryDto(
+                id=room[RoomRef.ID],
+                name=room[RoomRef.NAME],
+                room_code=room.get(RoomRef.ROOM_CODE),
+                owner_id=room.get(RoomRef.OWNER_ID),
+                member_count=len(room.get(RoomRef.USERS) or ()),
+            )
+
+    return {
+        "message": "User rooms fetched",
+        # Rooms deleted since the page was read are left out.
+        "rooms": [
+            rooms[room_id].model_dump() for room_id in room_ids if room_id in rooms
+        ],
+        "next_cursor": next_cursor,
+    }
 
 
 @router.get("/preference")
 async def get_common_interests(
     user_ids: Annotated[list[str], Query(..., alias="user_ids")], 
-    event_time: Annotated[str, Query(..., alias="event_time")]
+    event_time: Annotated[str, Query(..., alias="event_time")],
+    user_loader: Annotated[UserLoader, Depends(get_user_loader)],
 ) -> dict:
     user_interests = {}
     users = {}
 
     async def fetch_user_preferences(user_id: str) -> None:
-        user = await get_user(user_id)
+        user = await user_loader.load(user_id)
         if not user:
             return
         users[user.id] = user
@@ -281,19 +346,14 @@ async def get_common_interests(
 
     all_interests = [interests for interests in user_interests.values()]
 
-    #Groq
-    client = Groq(api_key="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")
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"Can you give me a location and activity on the Monash Clayton Campus in Melbourne, Victoria that can satisfy one of these activities for a group of individuals: {', '.join(all_interests)} at the time {event_time}. Make sure that the information you give is ONLY the location and the activity to do and not any more details, just give the location and activity in 2-3 words do not elaborate any further. Also make sure to put the location in quotation marks. Also provide the general location as well that's within the Clayton Campus like the area. Some suggestions are badminton courts, basketball courts, gym, MEGA PC Gaming lounge (you must say its the MEGA PC Gaming lounge) in the Campus centre basement, The Arcade which has 'billiard tables, foosball, dartboards, air hockey, video games' at the sports facility (suggested for people with very mixed interests), and a walk around the Campus's lake.",
-            }
-        ],
-        model="llama-3.3-70b-versatile",
-        stream=False,
-    )
-    suggested_location = chat_completion.choices[0].message.content.strip()
+    try:
+        suggested_location = await suggestion_service.suggest(all_interests, event_time)
+    except SuggestionUnavailableError:
+        _log.exception("Could not get a suggestion")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Suggestions are unavailable right now, try again shortly",
+        )
 
     return {
         "message": "Common interests determined",
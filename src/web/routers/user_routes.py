@@ -1,18 +1,16 @@
 import os
 import logging
-import random
-import string
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Annotated
 from itsdangerous import URLSafeTimedSerializer
-from modules.mail import mail, create_message
+from modules.mail import mail_outbox
 
-import config
 from models.user_models import UserDto
-from modules.db import CollectionRef, UserRef
+from modules.db import CollectionRef, Database, UserRef, get_database
 from web.auth import require_api_key
-from web.user_auth import get_user, get_password_hash
+from web.user_auth import get_user, invalidate_user
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 
@@ -25,8 +23,10 @@ router = APIRouter(
 
 
 @router.get("/by-uuid/{user_id}")
-async def get_user_by_uuid(user_id: str) -> dict:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+async def get_user_by_uuid(
+    user_id: str, db: Annotated[Database, Depends(get_database)]
+) -> dict:
+    user_collection = db.collection(CollectionRef.USERS)
     user = await user_collection.find_one({UserRef.ID: user_id})
     if user is None:
         raise HTTPException(
@@ -38,8 +38,10 @@ async def get_user_by_uuid(user_id: str) -> dict:
 
 
 @router.get("/by-email/{email}")
-async def get_user_by_email(email: str) -> dict:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+async def get_user_by_email(
+    email: str, db: Annotated[Database, Depends(get_database)]
+) -> dict:
+    user_collection = db.collection(CollectionRef.USERS)
     user = await user_collection.find_one({UserRef.EMAIL: email})
     if user is None:
         raise HTTPException(
@@ -70,8 +72,10 @@ def decode_url_safe_token(token: str):
 
 # NOTE: A follow-up POST users/account/reset-password must be sent.
 @router.post("/")
-async def register_user(user: UserDto) -> dict:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+async def register_user(
+    user: UserDto, db: Annotated[Database, Depends(get_database)]
+) -> dict:
+    user_collection = db.collection(CollectionRef.USERS)
     user.email = user.email.lower()
     user.id = str(uuid.uuid4())  # UUID4 will always be unique
     # if await user_collection.find_one({UserRef.ID: user.id}):
@@ -86,8 +90,9 @@ async def register_user(user: UserDto) -> dict:
             detail="User with the same email already exists",
         )
 
-    random_password = "".join(random.choices(string.ascii_letters, k=32))
-    user.hashed_password = get_password_hash(random_password)
+    # No password until the follow-up reset-password call sets one; users
+    # without a hash cannot log in.
+    user.hashed_password = None
 
     # send the email verification to the user
     # user.email
@@ -98,23 +103,21 @@ async def register_user(user: UserDto) -> dict:
     <p>Please click the <a href="{link}">link</a> below to verify your email address</p>
     """
 
-    await mail.send_message(
-        create_message(
-            recipients=[user.email],
-            subject="Verify your email",
-            body=html_messsage,
-        )
-    )
-
     await user_collection.insert_one(user.model_dump())
 
     _log.info(f"User {user.id} created")
 
+    await mail_outbox.enqueue(
+        recipients=[user.email],
+        subject="Verify your email",
+        body=html_messsage,
+    )
+
     return {"message": "User created", "user": user}
 
 
 @router.post("/verify/{token}")
-async def verify_user(token:str):
+async def verify_user(token:str, db: Annotated[Database, Depends(get_database)]):
     tokenData = decode_url_safe_token(token)
     print("user clicked the link")
     user_email = tokenData.get("email")
@@ -123,12 +126,13 @@ async def verify_user(token:str):
         print("user email found")
         user = await get_user(user_email)
         if user:
-            user_collection = await config.db.get_collection(CollectionRef.USERS)
+            user_collection = db.collection(CollectionRef.USERS)
 
             user.account_verified = True
             await user_collection.update_one(
                 {UserRef.ID: user.id}, {"$set": user.model_dump_safe()}
             )
+            invalidate_user(user.id)
 
             return {"message": "User email has been successfully verified"}
     
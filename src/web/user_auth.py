@@ -1,39 +1,135 @@
 # See https://fastapi.tiangolo.com/tutorial/security/oauth2-jwt/#about-jwt
 
+import itertools
 import os
+import time
 import jwt
 
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
 from typing import Annotated
 
-import config
 from models.auth_models import TokenDataDto
 from models.user_models import UserDto
-from modules.db import CollectionRef, UserRef
+from modules.db import CollectionRef, UserRef, database
+from modules.passwords import PasswordHasherBusyError, password_hasher
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 43800  # one month
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-def verify_password(plain_password: str | bytes, hashed_password: str | bytes) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class PrincipalCache:
+    """Short-lived in-process cache of the users behind validated tokens,
+    keyed by the token `sub`.
+
+    Every user has a version that `invalidate` bumps whenever the user document
+    is written. A lookup that started before the write carries the old version
+    and is not stored, so a racing request cannot put stale data back.
+    Other processes only see the write once their entry expires.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10_000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[int, float, UserDto]] = {}
+        self._versions: dict[str, int] = {}
+        self._counter = itertools.count(1)
+
+    def configure(
+        self, ttl: float | None = None, max_entries: int | None = None
+    ) -> None:
+        if ttl is not None:
+            self.ttl = ttl
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+    def version(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def get(self, user_id: str) -> UserDto | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+
+        version, expires_at, user = entry
+        if version != self.version(user_id) or expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+
+        # Routes mutate the user they are given, so never hand out the cached one.
+        return user.model_copy()
+
+    def put(self, user_id: str, user: UserDto, version: int) -> None:
+        if self.ttl <= 0 or version != self.version(user_id):
+            return
+
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[user_id] = (
+            version,
+            time.monotonic() + self.ttl,
+            user.model_copy(),
+        )
+
+    def invalidate(self, user_id: str) -> None:
+        self._versions[user_id] = next(self._counter)
+        self._entries.pop(user_id, None)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [
+            user_id
+            for user_id, (_, expires_at, _) in self._entries.items()
+            if expires_at < now
+        ]
+        for user_id in expired:
+            del self._entries[user_id]
+
+        # Still full, drop the oldest insertions.
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_user(user_id: str) -> None:
+    """Must be called after writing a user document so authenticated requests
+    stop seeing the cached copy."""
+    principal_cache.invalidate(user_id)
+
+
+async def verify_password(
+    plain_password: str | bytes, hashed_password: str | bytes
+) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
 
 
-def get_password_hash(password: str | bytes) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str | bytes) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password changes in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
 
 
 async def get_user(id: str) -> None | UserDto:
-    user_collection = await config.db.get_collection(CollectionRef.USERS)
+    user_collection = database.collection(CollectionRef.USERS)
     user = await user_collection.find_one({UserRef.EMAIL: id.lower()})
     if user is None:
         user = await user_collection.find_one({UserRef.ID: id})
@@ -44,9 +140,9 @@ async def get_user(id: str) -> None | UserDto:
 
 async def authenticate_user(id: str, password: str) -> bool | UserDto:
     user = await get_user(id)
-    if not user:
+    if not user or not user.hashed_password:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -76,9 +172,16 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Use
         token_data = TokenDataDto(id=id)
     except InvalidTokenError:
         raise credentials_exception
+
+    user = principal_cache.get(token_data.id)
+    if user is not None:
+        return user
+
+    version = principal_cache.version(token_data.id)
     user = await get_user(id=token_data.id)
     if user is None:
         raise credentials_exception
+    principal_cache.put(token_data.id, user, version)
     return user
 
 
@@ -0,0 +1,73 @@
+# The `from`/`to` time window calendar endpoints are asked for. Only events in
+# the window are expanded, serialized and used to find free times.
+
+import time
+from datetime import datetime, timedelta
+from typing import Annotated
+
+from fastapi import HTTPException, Query, status
+
+import config
+from modules.ical import EventStore
+
+
+class EventWindow:
+    """`[start, end)` in epoch seconds, or unbounded when both are None.
+
+    Unbounded windows return every event, with recurring events expanded up to
+    `horizon` since they may never end.
+    """
+
+    def __init__(self, start: int | None, end: int | None, horizon: int) -> None:
+        self.start = start
+        self.end = end
+        self.horizon = horizon
+
+    @property
+    def bounds(self) -> tuple[int, int] | None:
+        if self.start is None:
+            return None
+        return self.start, self.end
+
+    def select(self, events: EventStore) -> EventStore:
+        if self.start is None:
+            return events.expand(self.horizon)
+        return events.window(self.start, self.end)
+
+
+def get_event_window(
+    from_: Annotated[datetime | None, Query(alias="from")] = None,
+    to: Annotated[datetime | None, Query()] = None,
+) -> EventWindow:
+    """FastAPI dependency reading the window from the query string. Giving only
+    one end makes a window of the default length; times without an offset are
+    local to the server, like the free times returned."""
+    calendar_config = config.app_config.calendar
+    horizon = int(time.time() + calendar_config.recurrence_horizon_days * 86400)
+    if from_ is None and to is None:
+        return EventWindow(None, None, horizon)
+
+    # Aware, so times with and without an offset can be compared.
+    if from_ is not None:
+        from_ = from_.astimezone()
+    if to is not None:
+        to = to.astimezone()
+
+    default_length = timedelta(days=calendar_config.default_window_days)
+    if from_ is None:
+        from_ = to - default_length
+    elif to is None:
+        to = from_ + default_length
+
+    if to <= from_:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="`to` must be after `from`",
+        )
+    elif to - from_ > timedelta(days=calendar_config.max_window_days):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Windows can span at most {calendar_config.max_window_days} days",
+        )
+
+    return EventWindow(int(from_.timestamp()), int(to.timestamp()), horizon)